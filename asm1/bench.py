@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+#************************************************************
+#   bench.py
+#   Benchmark the hashi solver over the puzzles in inputs/ and a fixed corpus of
+#   bridgen puzzles (5x5 up to 100x100, a few seeds per size).
+#
+#   The corpus is generated once into the corpus directory with `bridgen nrow ncol seed`,
+#   so the same seeds give the same puzzles on every run (on the same libc).
+#   Every puzzle is solved in a fresh worker process (this script with --worker) so that a
+#   timeout can kill it and its peak memory is measured on its own. The worker reports
+#   solve time, search nodes expanded, backtracks and peak RSS, and checks the solution with
+#   hashi_verify; the results are printed as a table and written as JSON.
+#
+#   Usage: python3 bench.py [--engine dfs sat] [--timeout 30] [--json outputs/bench.json]
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BRIDGEN = os.path.join(HERE, 'bridgen')
+CORPUS_SIZES = [5, 10, 15, 20, 25, 30, 40, 50, 60, 80, 100]
+CORPUS_SEEDS = [1, 2, 3]
+
+# Generate the missing corpus puzzles, returns their paths in size order
+def build_corpus(corpus_dir, sizes, seeds):
+    os.makedirs(corpus_dir, exist_ok=True)
+    paths = []
+    for size in sizes:
+        for seed in seeds:
+            path = os.path.join(corpus_dir, f"bridgen_{size}x{size}_s{seed}.in")
+            if not os.path.exists(path):
+                puzzle = subprocess.run([BRIDGEN, str(size), str(size), str(seed)],
+                                        check=True, capture_output=True, text=True).stdout
+                with open(path, 'w') as f:
+                    f.write(puzzle)
+            paths.append(path)
+    return paths
+
+# Solve one puzzle in this process and print one JSON line with the measurements.
+# Solutions are checked with hashi_verify, a wrong one is reported as such.
+def worker(path, engine, branching, probe=0):
+    import hashi
+    import hashi_verify
+    result = {'status': 'error'}
+    try:
+        with open(path) as f:
+            sys.stdin = f
+            nrow, ncol, i_map = hashi.scan_map()
+        puzzle = i_map.copy()
+        start = time.perf_counter()
+        is_solved = hashi.solve_map(i_map, nrow, ncol, engine, branching, probe=probe)
+        result = {
+            'status': 'solved' if is_solved else 'unsolved',
+            'time': time.perf_counter() - start,
+            'islands': len(hashi.island_value),
+            'nodes': hashi.stats['nodes'],
+            'backtracks': hashi.stats['backtracks'],
+            'stats': hashi.stats,
+        }
+        if is_solved:
+            errors = hashi_verify.verify_bridges(puzzle, hashi.bridge_rows(hashi.list_bridges()))
+            if errors:
+                result['status'] = 'wrong'
+                result['error'] = errors[0]
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(result))
+    return 0
+
+def run_one(path, engine, branching, timeout, probe=0):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', path,
+           '--engine', engine, '--branching', branching, '--probe', str(probe)]
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, cwd=HERE)
+        lines = proc.stdout.strip().splitlines()
+        result = json.loads(lines[-1]) if lines else {'status': 'error', 'error': proc.stderr.strip()[-200:]}
+    except subprocess.TimeoutExpired:
+        result = {'status': 'timeout'}
+    result['wall'] = time.perf_counter() - start
+    result.update({'puzzle': os.path.relpath(path, HERE), 'engine': engine, 'branching': branching, 'probe': probe})
+    return result
+
+def print_row(r):
+    def fmt(key, spec):
+        return format(r[key], spec) if r.get(key) is not None else '-'
+    print(f"{r['puzzle']:<36} {r['engine']:<4} {r['status']:<9} {fmt('islands', 'd'):>7} "
+          f"{fmt('time', '.3f'):>9} {fmt('wall', '.3f'):>9} {fmt('nodes', 'd'):>9} "
+          f"{fmt('backtracks', 'd'):>10} {fmt('peak_mb', '.1f'):>8}", flush=True)
+
+def main():
+    import hashi
+    parser = argparse.ArgumentParser(description="Benchmark hashi.py over inputs/ and a seeded bridgen corpus.")
+    parser.add_argument('--engine', nargs='+', choices=['dfs', 'sat'], default=['dfs'],
+                        help="engine(s) to run on every puzzle (default: dfs)")
+    parser.add_argument('--branching', choices=list(hashi.BRANCHING_HEURISTICS), default=hashi.DEFAULT_BRANCHING)
+    parser.add_argument('--probe', metavar='N', type=int, default=0,
+                        help="slots probed before every branch, see hashi.py --probe (default: 0)")
+    parser.add_argument('--timeout', type=float, default=30, help="seconds per puzzle (default: 30)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=CORPUS_SIZES, help="corpus map sizes")
+    parser.add_argument('--seeds', type=int, nargs='+', default=CORPUS_SEEDS, help="bridgen seeds per size")
+    parser.add_argument('--corpus-dir', default=os.path.join(HERE, 'outputs', 'corpus'))
+    parser.add_argument('--no-inputs', action='store_true', help="skip the puzzles in inputs/")
+    parser.add_argument('--json', default=os.path.join(HERE, 'outputs', 'bench.json'),
+                        help="where to write the results (default: outputs/bench.json)")
+    parser.add_argument('--worker', metavar='PUZZLE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.worker, args.engine[0], args.branching, args.probe)
+
+    paths = [] if args.no_inputs else sorted(glob.glob(os.path.join(HERE, 'inputs', '*.in')))
+    paths += build_corpus(args.corpus_dir, args.sizes, args.seeds)
+
+    print(f"{'puzzle':<36} {'eng':<4} {'status':<9} {'islands':>7} {'solve(s)':>9} {'wall(s)':>9} "
+          f"{'nodes':>9} {'backtracks':>10} {'peak(MB)':>8}")
+    results = []
+    for path in paths:
+        for engine in args.engine:
+            result = run_one(path, engine, args.branching, args.timeout, args.probe)
+            print_row(result)
+            results.append(result)
+
+    solved = [r for r in results if r['status'] == 'solved']
+    print(f"\n{len(solved)}/{len(results)} solved, "
+          f"{sum(r['status'] == 'timeout' for r in results)} timed out, "
+          f"total solve time {sum(r['time'] for r in solved):.2f}s")
+    os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+    with open(args.json, 'w') as f:
+        json.dump({'timeout': args.timeout, 'results': results}, f, indent=1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -271,14 +271,15 @@ int main( int argc, char *argv[] )
   int nplank[MAX_ROW][MAX_COL];
   int max_plank = 3;
   int nrow, ncol;
+  unsigned int seed;
   int nfail;
   int r,c;
 
   if( argc < 2 || !isdigit(argv[1][0])) {
-    printf("Usage: %s <nrow> [ncol]\n",argv[0]);
+    printf("Usage: %s <nrow> [ncol [seed]]\n",argv[0]);
     printf("Generate a random Hashi puzzle of size nrow x ncol;\n");
     printf("can be run repeatedly, producing different puzzles each time;\n");
-    printf("ncol defaults to nrow.\n");
+    printf("ncol defaults to nrow, the same seed always gives the same puzzle.\n");
     return 0;
   }
   else {
@@ -302,7 +303,13 @@ int main( int argc, char *argv[] )
   if( ncol > MAX_COL ) {
     ncol = MAX_COL;
   }
-  srandom(time(NULL));
+  if( argc < 4 ) {
+    seed = time(NULL);
+  }
+  else {
+    seed = strtoul(argv[3], NULL, 10);
+  }
+  srandom(seed);
 
   for( r=0; r < nrow; r++ ) {
     for( c=0; c < ncol; c++ ) {
@@ -1,21 +1,45 @@
 #!/usr/bin/python3
 #************************************************************
 #   hashi.py
-#   Once the map is scanned, store all the islands in an array of dictionay,
-#   The Island dictionary contains information about the islands':
-#       1. coordinate(x,y); 
-#       2. value of the island; 
-#       3. capacity(value - # all connected bridges)
-#       4. position (island's position in the array); 
-#       5. neighbours: a list of {'neighbour_node_xy', 'position_in_array'}
-#       6. is_completed: a boolean value indicating if an island is exhausted and satisfies constraints. 
+#   Once the map is scanned, the islands are numbered in scan order (row by row)
+#   and their state is kept in a set of numpy arrays indexed by island number:
+#       1. island_xy:       coordinate(x,y);
+#       2. island_value:    value of the island;
+#       3. capacity:        value - # all connected bridges;
+#       4. neighbour:       a (n, 4) table holding the island visible in each direction
+#                           (NORTH, EAST, SOUTH, WEST), -1 if there is none;
+#       5. neighbour_open:  a (n, 4) table of flags, True if a bridge can still be added in that slot
+#                           (the slot is not crossed, not full, not decided by the search,
+#                           and both ends still have capacity);
+#       6. crossings:       a (n, 4) table counting the bridges built across each slot;
+#       7. decided:         a (n, 4) table of flags, True once the bridges of the slot are fixed
+#                           (by the search, or by the lemmas when no more bridges fit in it).
+#
+#   The search only depends on part of this state: the capacity of every island and, for every edge,
+#   its bridges while it is open, or whether it has any once it is closed (edge_status). state_hash
+#   keeps a Zobrist hash of that part up to date, and the states the search proved to have no
+#   solution are kept by hash in the nogoods table (least recently used ones dropped first), so the
+#   search backs out of them when it reaches them again by another route.
+#
+#   Islands joined by bridges are grouped with a union-find (component_parent / component_size),
+#   which also keeps the capacity left in every group (component_capacity) so that a group which
+#   used up all its capacity without reaching every island is detected as soon as it is closed.
+#
+#   Bridges are stored in a (n, n) matrix bridge_count holding the number of parallel bridges
+#   between every pair of islands; the map itself stores -count on every cell a bridge runs over,
+#   and bridge_dirn (same shape as the map) whether that bridge is HORIZONTAL or VERTICAL.
+#   Every potential bridge (pair of neighbouring islands) is numbered once at load time as an edge:
+#   edge_ends holds its two islands, edge_slot its slot (EAST or SOUTH) at the first of them, edge_of
+#   the edge in every slot, and edge_conflicts the list of edges it would cross (crossing_pairs holds
+#   every crossing once, as a pair of edges), so building a bridge never has to scan the map for the
+#   bridges it blocks.
 #
-#   Bridges are also stored in an array to keep track of the direction on the map,
-#   which contains: 1. the coordinates of both ends of the bridge; 
-#                   2. number of parallel bridges; 3. direction of the bridge (flat/vertical)
-#   
 #   Procedures:
 #   Pre-Iterative Search processing: 
+#       Every open slot can take at most room more bridges (slot_room): MaxBridgeNum(3) less the bridges
+#       already there, no more than the capacity of either end, and no more than leaves some capacity
+#       to the group of islands it joins (unless that group is the whole map), as a closed group can
+#       never reach the rest of the map (two 1s can never be joined, two 2s only by a single bridge).
 #       Given the constraints, we can deduce that 
 #           1.  all islands with only 1 available neighbour island 
 #               must connect with their neighbours with all their capacity;
@@ -24,708 +48,1007 @@
 #           hence> 2.1. an island with capacity 6 with 2 neighbours must connect both with 3 bridges; 
 #                       an island with capacity 9 with 3 neighbours must connect both with 3 bridges; 
 #                       an island with capacity a / 12 with 4 neighbours must connect both with 3 bridges; 
+#           3.  in general, with the rooms of its open slots adding up to total, an island must build
+#               at least room - (total - capacity) bridges in every slot (all of the room once capacity
+#               equals total);
+#           4.  a slot without room is closed for good.
 #   The step above guarantees that all bridges built are necessary according to the constraints.
+#   The lemmas are driven by a worklist: every island whose capacity or open slots change is queued,
+#   along with the islands whose slot rooms that changes (the open neighbours of an island whose
+#   capacity dropped, and the group of islands around it once the group runs low on capacity),
+#   and only queued islands are checked again, so a pass costs time in the number of changes made
+#   rather than in sweeps over every island.
 #
 #   Algorithm: 
-#       Idea: For all remaining unfinished nodes, try build 0 ~ 3 bridges with available neighbours
+#       Idea: Decide the remaining open slots one at a time, trying every amount of bridges each can take
 #   Pseudo-Code:
 #     search():
-#       An iterative DFS search. 
-#       Base Case: if all neighbours of the current island have been searched, go to next island
+#       An iterative DFS over an explicit stack of choice points.
+#       Base Case: if no slot is open, the map is solved if every island is exhausted, else it is a dead end
 #       Main Explore Loop: 
-#           for i in [0, 1, 2, 3]: 
-#               try build [No, 1, 2, 3] bridge(s) from the island to the current neighbour
-#               calls search()  with the updated bridges info, nodes info,
-#                               and increment the index for neighbour 
-#                               such that it searches the next neighbour / island available 
-#       Final Check:    if we hit this, we are at the end of a DFS tree / the top of the stack 
-#                       thus we check if all nodes are finished(i.e. all their capacities are exhausted)
-#                       if this is not satisfied, return False, and the (top - 1) stack continues to try 
-#                       build a different amount of bridges until a valid map is built
+#           pick an open slot with the branching heuristic (most constrained first by default)
+#           for b in [most, ..., least] bridges the slot can still take (upwards with ascending):
+#               build b bridges in the slot, close it, and apply the lemmas again (propagate)
+#               to everything the new bridges changed
+#               if that leaves the map consistent, go on with the next open slot
+#       Dead End:       roll back with the undo trail to the deepest choice point with amounts left
+#                       and try its next amount; if there is none, the map has no solution
 #   Validation of the algo: Given we have at most 800 bridges to be built, 
 #                           there is a maximum amount of 4 ^ 800 iterative checks to be done which is too large.
-#                           Therefore a pre-iterative search processing is applied, but this still may leave a
-#                           large amount of possibilities to be searched.
-#                           To reduce the amount of iterative checks to be made, I've considered (but yet to implement)
-#                           applying the Pre-Iterative search processing every time a new bridge is built.
+#                           Therefore a pre-iterative search processing is applied, and it is applied again
+#                           every time the search builds a bridge, so every choice is followed by the bridges
+#                           it forces and most dead ends show up right after the choice that caused them.
+import argparse
+import collections
 import numpy as np
+import re
 import sys
+import time
 nrow = 0
 ncol = 0
 code = ".123456789abc"
-nodes = []
-# bridge = {
-#     'ends'  : [node_0, node_1],
-#     'val'   : int < 0,
-#     'is_hor': Bool,
-# }
-bridges = []
+bridge_code = "-=E|\"#"
 MAX_BRIDGE_NUM = 3
 bridge_tuning = False
-def find_vert(x, y, i_map, nrow):
-    hori_neightbours = []
-    for i in reversed(range(0, x)):
-        if (i_map[i][y] < 0):
-            break
-        if (i_map[i][y] > 0):
-            # print(f"Closest island for {(x,y)} = {i_map[x][y]} in adscending vertical order (top of) is {(i, y)} = {i_map[i][y]}")
-            hori_neightbours.append((i, y))
-            break
-    for i in range(x + 1, nrow):
-        if (i_map[i][y] < 0):
-            break
-        if (i_map[i][y] > 0):
-            # print(f"Closest island for {(x,y)} = {i_map[x][y]} in descending vertical order (bottom of) is {(i, y)} = {i_map[i][y]}")
-            hori_neightbours.append((i, y))
-            break
-    return hori_neightbours
 
-def find_hori(x, y, i_map, ncol):
-    vert_neightbours = []
-    for i in reversed(range(0, y)):
-        if (i_map[x][i] < 0):
-            # Blocked
-            break
-        if (i_map[x][i] > 0):
-            # print(f"Closest island for {(x,y)} = {i_map[x][y]} in adscending horizontal order (left of) is {(x, i)} = {i_map[x][i]}")
-            vert_neightbours.append((x, i))
-            break
-    for i in range(y + 1, ncol):
-        if (i_map[x][i] < 0):
-            # Blocked
-            break
-        if (i_map[x][i] > 0):
-            # print(f"Closest island for {(x,y)} = {i_map[x][y]} in descending horizontal order (right of) is {(x, i)} = {i_map[x][i]}")
-            vert_neightbours.append((x, i))
-            break
-    return vert_neightbours
-
-# Given a pair of coordinates representing the an island, find its direct connectable neighbours. 
-def find_neighbours(coord, i_map, nrow, ncol):
-    x = int(coord[0])
-    y = int(coord[1])
-    # print(f"Finding for {(x, y)} = {code[i_map[x,y]]}")
-
-    neighbours = find_hori(x, y, i_map, ncol) + find_vert(x, y, i_map, nrow)
-    # print(f"All neighbours for {(x, y)} = {code[i_map[x,y]]}: {neighbours}")
-    return neighbours
-
-def check_lemma(node):
-    # print(f"Checking for\n\t{node}")
-    if (node['capacity'] == 0):          return -1
-    if (len(node['neighbours']) == 0):  return -1
-    # if ()
-    if (len(node['neighbours']) == 1):                              return 0
-    if node['value'] == 12:   return 1
-    if node['capacity'] > ((len(node['neighbours']) - 1) * MAX_BRIDGE_NUM): return 2
-    return -1
+# Neighbour slots, in the order they are stored in the neighbour table
+NORTH = 0
+EAST  = 1
+SOUTH = 2
+WEST  = 3
 
-def iterative_check(node):
-    # Check existing
-    return 0
+# Orientation of the bridge over a cell, as stored in bridge_dirn
+HORIZONTAL = 1
+VERTICAL   = 2
 
-def find_node(node, nodes):
-    for idx, n in enumerate(nodes):
-        if n['xy'] == node:
-            return idx
+# Cell value of every input byte: '.' water, '1'-'9' and 'a'-'c' islands, BAD_CELL for anything else
+BAD_CELL = -1
+cell_table = np.full(256, BAD_CELL, dtype=np.int8)
+cell_table[np.frombuffer(code.encode(), dtype=np.uint8)] = np.arange(len(code))
 
-def bridge_contains(node_0, node_1, bridges):
-    for idx, bridge in enumerate(bridges):
-        if node_0 in bridge['ends'] and node_1 in bridge['ends']:
-            return idx
-    return -1
+# Character for every cell value: island values 0..12, then horizontal and vertical bridges of 1..3
+glyphs = np.frombuffer((code + bridge_code).encode(), dtype=np.uint8)
+# and back, to read a printed solution
+glyph_table = np.full(256, BAD_CELL, dtype=np.int8)
+glyph_table[glyphs] = np.arange(len(glyphs))
 
-def bridge_uncolor_all():
-    for bridge in bridges:
-        bridge['is_new'] = False
-
-# idx = idx of node_0
-def build_bridge(node_0, node_1, idx, i_map, val, nrow, ncol, nodes, bridges):
-    if bridge_tuning: print(f"--------------------------------------\nTrying to build the {len(bridges)}th connection: {-val} bridge(s) from {node_0} = {i_map[node_0]} to {node_1} = {i_map[node_1]}")
-    bridge_uncolor_all()
-    (x0, y0) = node_0
-    (x1, y1) = node_1
-    bridge_range = []
-    if (x0 == x1):
-        horizontal_bridge_range = range(y0 + 1, y1)
-        if len(range(y0 + 1, y1)) == 0:
-            horizontal_bridge_range = reversed(range(y1 + 1, y0))
-        for i in horizontal_bridge_range:
-            i_map[x0, i] = val
-    elif (y0 == y1):
-        vertical_bridge_range = range(x0 + 1, x1)
-        if len(range(x0 + 1, x1)) == 0:
-            vertical_bridge_range = reversed(range(x1 + 1, x0))
-        for i in vertical_bridge_range:
-            i_map[i, y0] = val
-    else:
-        print(f"Error, bridge cannot be built")
-        quit()
-    # Organise the ends of the bridge
+# Island / bridge state, filled in by load_islands()
+island_xy = None
+island_value = None
+capacity = None
+neighbour = None
+neighbour_open = None
+crossings = None
+decided = None
+bridge_count = None
+edge_ends = None
+edge_slot = None
+edge_of = None
+edge_conflicts = []
+crossing_pairs = None
+component_parent = None
+component_size = None
+component_capacity = None
+# Island index for every cell of the map, -1 for water
+island_at = None
+bridge_dirn = None
+# Random tie-breaks of the mrv-random branching, seeded by solve_map()
+rng = np.random.default_rng()
+# Counters and timings of the current solve, reset by solve_map(). Only counters are updated
+# in the search loop, nothing is printed.
+LEMMA_NAMES = {0: 'one_neighbour', 1: 'all_neighbours', 2: 'capped_neighbours', 3: 'isolation'}
+def new_stats():
+    return {
+        'nodes': 0,             # choices tried by search()
+        'backtracks': 0,        # dead ends backed out of
+        'max_depth': 0,         # deepest stack of choice points
+        'bridges_built': 0,     # bridge counts raised by build_bridge()
+        'bridges_undone': 0,    # and rolled back by undo(), counted at the end of solve_map()
+        'splits': 0,            # nodes whose open slots fell apart into independent components
+        'nogood_hits': 0,       # nodes found in the nogoods table
+        'probes': 0,            # values tried out by probe_slots()
+        'probe_hits': 0,        # slots whose values probing narrowed down
+        'lemma_hits': {'one_neighbour': 0, 'all_neighbours': 0, 'capped_neighbours': 0, 'isolation': 0,
+                       'contradiction': 0},
+        'time': {},             # seconds per phase: parse, lemma, search, render
+    }
+stats = new_stats()
+# Zobrist keys of every capacity of every island and of every status of every edge, the edge
+# status (bridges while open, EDGE_BUILT / EDGE_EMPTY once closed) and the hash of the state
+# made of them, in a list so that it can be trailed
+EDGE_BUILT = MAX_BRIDGE_NUM
+EDGE_EMPTY = MAX_BRIDGE_NUM + 1
+zobrist_capacity = []
+zobrist_edge = []
+edge_status = None
+state_hash = [0]
+# Hashes of the states known to have no solution, least recently used first
+NOGOOD_TABLE_SIZE = 1 << 17
+nogoods = collections.OrderedDict()
+# Islands to check the lemmas on again, and whether each island is in there. Not part of the
+# state rolled back by undo(): checking an island that did not change is only a wasted check.
+worklist = collections.deque()
+queued = []
+# Undo trail: every write to the state above (and to the map) is recorded as
+# (array, index, previous value) so that the search can roll back to a mark
+trail = []
+
+def opposite(slot):
+    return (slot + 2) % 4
+
+# The island visible in each slot of every island, -1 if there is none. Islands are numbered in
+# scan order, so the next island is the one to the EAST if it is on the same row; sorting them by
+# column then row gives, the same way, the island to the SOUTH.
+def load_neighbours():
+    n = len(island_xy)
+    table = np.full((n, 4), -1, dtype=np.int32)
+    west = np.flatnonzero(island_xy[1:, 0] == island_xy[:-1, 0])
+    table[west, EAST] = west + 1
+    table[west + 1, WEST] = west
+    by_col = np.lexsort((island_xy[:, 0], island_xy[:, 1]))
+    same_col = island_xy[by_col[1:], 1] == island_xy[by_col[:-1], 1]
+    (north, south) = (by_col[:-1][same_col], by_col[1:][same_col])
+    table[north, SOUTH] = south
+    table[south, NORTH] = north
+    return table
+
+def load_islands(i_map, nrow, ncol):
+    global island_xy, island_value, capacity, neighbour, neighbour_open, crossings, decided, queued
+    global bridge_count, edge_ends, edge_of, edge_conflicts, component_parent, component_size, component_capacity, island_at
+    global bridge_dirn, zobrist_capacity, zobrist_edge, edge_status
+    # Everything below is rebuilt from the map, so one process can solve many maps in turn
+    del trail[:]
+    island_xy = np.argwhere(i_map > 0).astype(np.int32)
+    n = len(island_xy)
+    island_value = i_map[i_map > 0].astype(np.int8)
+    capacity = island_value.copy()
+    island_at = np.full((nrow, ncol), -1, dtype=np.int32)
+    island_at[island_xy[:, 0], island_xy[:, 1]] = np.arange(n, dtype=np.int32)
+    bridge_dirn = np.zeros((nrow, ncol), dtype=np.int8)
+    neighbour = load_neighbours()
+    neighbour_open = neighbour >= 0
+    load_edges()
+    crossings = np.zeros((n, 4), dtype=np.int16)
+    decided = np.zeros((n, 4), dtype=bool)
+    bridge_count = np.zeros((n, n), dtype=np.int8)
+    component_parent = np.arange(n, dtype=np.int32)
+    component_size = np.ones(n, dtype=np.int32)
+    component_capacity = island_value.astype(np.int32)
+    # Every island is checked by the first lemma pass
+    worklist.clear()
+    worklist.extend(range(n))
+    queued = [True] * n
+    # Fixed keys, so that a map is searched the same way every time
+    keys = np.random.default_rng(0)
+    zobrist_capacity = keys.integers(0, 1 << 63, size=(n, len(code))).tolist()
+    zobrist_edge = keys.integers(0, 1 << 63, size=(len(edge_ends), EDGE_EMPTY + 1)).tolist()
+    edge_status = np.zeros(len(edge_ends), dtype=np.int8)
+    state_hash[0] = 0
+    for idx in range(n):
+        state_hash[0] ^= zobrist_capacity[idx][island_value[idx]]
+    for edge in range(len(edge_ends)):
+        state_hash[0] ^= zobrist_edge[edge][0]
+    nogoods.clear()
+
+# Number the potential bridges and find, for each of them, the potential bridges it crosses
+def load_edges():
+    global edge_ends, edge_slot, edge_of, edge_conflicts, crossing_pairs
+    n = len(neighbour)
+    edge_of = np.full((n, 4), -1, dtype=np.int32)
+    # Horizontal edges first (numbered from their west end), then vertical ones (from their north end)
     ends = []
-    if (x0 <= x1 and y0 <= y1):
-        ends = [node_0, node_1]
-    else:
-        ends = [node_1, node_0]
-    # Update bridge value or build new bridge
-    bridge_idx = bridge_contains(node_0, node_1, bridges)
-    #  -3 - bridges[bridge_idx]['val']
-    pre_operation_bridge_val = 0
-    if (bridge_idx != -1):
-        pre_operation_bridge_val = bridges[bridge_idx]['val']
-        bridges[bridge_idx]['val'] = val
-        bridges[bridge_idx]['is_new'] = True
-    else:
-        bridges.append({
-            'ends'  : ends,
-            'val'   : val,
-            'is_hor': x0==x1,
-            'lemma_val':val,
-            'is_new': True,
-        })
-    if bridge_tuning: print(f"Updating neighbours on the side of ends: {ends}")
-    # Update affected nodes due to new bridge
-    # TODO: add neighbours back if bridge destroyed
-    if (x0==x1):
-        for i in range(ends[0][1]+1,ends[1][1]):
-            # print(f"{(x0, i)}")
-            update_islands_perpendicular_to_bridge(True, x0, i, i_map, nrow, ncol, nodes, val)
-    else:
-    # print(ends[0][0]+1,ends[0][1])
-        for i in range(ends[0][0]+1,ends[1][0]):
-            # print(f"{(i, y0)}")
-            update_islands_perpendicular_to_bridge(False, i, y0, i_map, nrow, ncol, nodes, val)
-    if bridge_tuning: print(f"Checking point 1: ")
-
-    # Update the node capacity
-    idx_1 = find_node(node_1, nodes)
-    nodes[idx]['capacity'] += (val- pre_operation_bridge_val)
-    nodes[idx_1]['capacity'] += (val- pre_operation_bridge_val)
-
-    # Update neighbours
-    if (bridges[bridge_idx]['val'] == -3):
-        remove_for_max_bridge(nodes[idx], nodes[idx_1])
-        if bridge_tuning: print(f"Checking point 2:")
-    if (nodes[idx]['capacity'] == 0):
-        # Current node satisfied. Remove it from others list
-        remove_current_node_in_neighbours_storage(nodes[idx])
-        if bridge_tuning: print(f"Checking point 3:")
-    if (nodes[idx_1]['capacity'] == 0):
-        # Remove it from others list
-        remove_current_node_in_neighbours_storage(nodes[idx_1])
-        if bridge_tuning: print(f"Checking point 4:")
-    if (val == 0):
-        add_neighbours_back(nodes[idx], nodes[idx_1], nodes)
-        if bridge_tuning: print(f"Checking point 5:")
-    if bridge_tuning: print(f"Bridge({val}) from {node_0} = {i_map[node_0]} to {node_1} = {i_map[node_1]} built\nAffected nodes:\n\t{nodes[idx]}\n\t{nodes[idx_1]}\nBridge:\n\t{bridges[bridge_idx]}\n--------------------------------------\n")
+    for slot in (EAST, SOUTH):
+        idx = np.flatnonzero(neighbour[:, slot] >= 0).astype(np.int32)
+        edges = np.arange(len(idx)) + sum(len(e) for e in ends)
+        edge_of[idx, slot] = edges
+        edge_of[neighbour[idx, slot], opposite(slot)] = edges
+        ends.append(np.stack([idx, neighbour[idx, slot]], axis=1))
+    edge_ends = np.concatenate(ends)
+    edge_slot = np.repeat(np.array([EAST, SOUTH], dtype=np.int32), [len(e) for e in ends])
+    xy_0 = island_xy[edge_ends[:, 0]]
+    xy_1 = island_xy[edge_ends[:, 1]]
+    hori = np.arange(len(ends[0]))
+    vert = np.arange(len(ends[0]), len(edge_ends))
+    # A horizontal and a vertical bridge cross if each runs strictly between the other's ends
+    cross = ((xy_0[vert, 0][None, :] < xy_0[hori, 0][:, None]) & (xy_0[hori, 0][:, None] < xy_1[vert, 0][None, :])
+             & (xy_0[hori, 1][:, None] < xy_0[vert, 1][None, :]) & (xy_0[vert, 1][None, :] < xy_1[hori, 1][:, None]))
+    (h, v) = np.nonzero(cross)
+    crossing_pairs = np.stack([hori[h], vert[v]], axis=1)
+    pairs = np.concatenate([crossing_pairs, crossing_pairs[:, ::-1]])
+    pairs = pairs[np.argsort(pairs[:, 0], kind='stable')]
+    bounds = np.searchsorted(pairs[:, 0], np.arange(len(edge_ends) + 1))
+    other = pairs[:, 1].tolist()
+    edge_conflicts = [other[bounds[e]:bounds[e + 1]] for e in range(len(edge_ends))]
+
+# Record the previous value of array[key] on the trail, then overwrite it
+def trail_set(array, key, val):
+    old = array[key]
+    if isinstance(old, np.ndarray):
+        old = old.copy()
+    trail.append((array, key, old))
+    array[key] = val
+
+def trail_mark():
+    return len(trail)
+
+# Roll the state back to a mark, in time proportional to the number of writes made since
+def undo(mark):
+    while len(trail) > mark:
+        (array, key, old) = trail.pop()
+        array[key] = old
+
+# Union-find without path compression, so that every union is a couple of trailed writes
+def find_component(idx):
+    while component_parent[idx] != idx:
+        idx = component_parent[idx]
+    return idx
+
+def join_components(idx_0, idx_1):
+    root_0 = find_component(idx_0)
+    root_1 = find_component(idx_1)
+    if (root_0 == root_1):
+        return root_0
+    if (component_size[root_0] < component_size[root_1]):
+        (root_0, root_1) = (root_1, root_0)
+    trail_set(component_parent, root_1, root_0)
+    trail_set(component_size, root_0, component_size[root_0] + component_size[root_1])
+    trail_set(component_capacity, root_0, component_capacity[root_0] + component_capacity[root_1])
+    return root_0
+
+def open_slots(idx):
+    return [slot for slot in range(4) if neighbour_open[idx, slot]]
+
+# Flip the availability flag of a slot (on both ends) after any of its conditions changed
+def refresh_slot(idx, slot):
+    idx_1 = neighbour[idx, slot]
+    if (idx_1 < 0):
+        return
+    is_open = (crossings[idx, slot] == 0 and not decided[idx, slot] and bridge_count[idx, idx_1] < MAX_BRIDGE_NUM
+               and capacity[idx] > 0 and capacity[idx_1] > 0)
+    if (neighbour_open[idx, slot] != is_open):
+        trail_set(neighbour_open, (idx, slot), is_open)
+        trail_set(neighbour_open, (idx_1, opposite(slot)), is_open)
+        enqueue(idx)
+        enqueue(idx_1)
+        rehash_edge(idx, slot)
+
+# Bring the status of the edge in a slot, and the state hash with it, up to date
+def rehash_edge(idx, slot):
+    edge = edge_of[idx, slot]
+    count = bridge_count[idx, neighbour[idx, slot]]
+    status = count if neighbour_open[idx, slot] else (EDGE_BUILT if count > 0 else EDGE_EMPTY)
+    old = edge_status[edge]
+    if (status != old):
+        trail_set(edge_status, edge, status)
+        trail_set(state_hash, 0, state_hash[0] ^ zobrist_edge[edge][old] ^ zobrist_edge[edge][status])
+
+def add_nogood(key):
+    nogoods[key] = True
+    if (len(nogoods) > NOGOOD_TABLE_SIZE):
+        nogoods.popitem(last=False)
+
+def enqueue(idx):
+    if not queued[idx]:
+        queued[idx] = True
+        worklist.append(idx)
+
+def clear_worklist():
+    for idx in worklist:
+        queued[idx] = False
+    worklist.clear()
+
+def refresh_island(idx):
+    for slot in range(4):
+        refresh_slot(idx, slot)
+
+# Close a slot for good once the search picked its number of bridges
+def decide_slot(idx, slot):
+    trail_set(decided, (idx, slot), True)
+    trail_set(decided, (neighbour[idx, slot], opposite(slot)), True)
+    refresh_slot(idx, slot)
+
+# Most bridges that can still be added in an open slot
+def slot_room(idx, slot):
+    idx_1 = neighbour[idx, slot]
+    (cap_0, cap_1) = (int(capacity[idx]), int(capacity[idx_1]))
+    room = min(MAX_BRIDGE_NUM - int(bridge_count[idx, idx_1]), cap_0, cap_1)
+    # The group joined keeps at least cap_0 + cap_1 - 2 * room, only a group with no more than
+    # that can be used up by these bridges
+    if (cap_0 + cap_1 > 2 * room):
+        return room
+    (root_0, root_1) = (find_component(idx), find_component(idx_1))
+    size = component_size[root_0] + (component_size[root_1] if root_0 != root_1 else 0)
+    if (size == len(capacity)):
+        return room
+    group_capacity = component_capacity[root_0] + (component_capacity[root_1] if root_0 != root_1 else 0)
+    return min(room, (int(group_capacity) - 1) // 2)
+
+# Returns -2 if the island can no longer be satisfied (capacity > room of all its open slots),
+#         -1 if no lemma applies to the island,
+#          0 if the island has a single open neighbour,
+#          1 if capacity > (#open neighbours - 1) * MAX_BRIDGE_NUM,
+#          2 if capacity > room of all its open slots but one, for some slot,
+#          3 if an open slot has no room left
+def check_lemma(idx):
+    if (capacity[idx] == 0): return -1
+    rooms = [slot_room(idx, slot) for slot in range(4) if neighbour_open[idx, slot]]
+    total = sum(rooms)
+    if capacity[idx] > total: return -2
+    if 0 in rooms:  return 3
+    k = len(rooms)
+    if (k == 1):    return 0
+    if capacity[idx] > ((k - 1) * MAX_BRIDGE_NUM): return 1
+    if capacity[idx] > total - max(rooms): return 2
+    return -1
+
+# Build the bridges forced by check_lemma, or close the slots without room.
+# Returns False if the island cannot be satisfied.
+def apply_lemma(idx, rule, i_map, nrow, ncol):
+    slots = open_slots(idx)
+    rooms = [slot_room(idx, slot) for slot in slots]
+    if (rule == 3):
+        for (slot, room) in zip(slots, rooms):
+            if (room == 0):
+                decide_slot(idx, slot)
+        return True
+    slack = sum(rooms) - int(capacity[idx])
+    for (slot, room) in zip(slots, rooms):
+        need = room - slack
+        if (need <= 0):
+            continue
+        idx_1 = neighbour[idx, slot]
+        val = int(bridge_count[idx, idx_1]) + need
+        if (val > MAX_BRIDGE_NUM or need > capacity[idx] or need > capacity[idx_1]):
+            if bridge_tuning: print(f"Island {island_xy[idx]} cannot take {need} more bridge(s) to {island_xy[idx_1]}")
+            return False
+        if not build_bridge(idx, slot, val, i_map, nrow, ncol):
+            return False
+    return True
+
+# Apply the lemmas to the queued islands until the queue runs dry: building bridges queues the
+# islands it changed. Returns False if some island can no longer be satisfied.
+def propagate(i_map, nrow, ncol, is_test):
+    while (worklist):
+        idx = worklist.popleft()
+        queued[idx] = False
+        rule = check_lemma(idx)
+        if (rule == -2):
+            stats['lemma_hits']['contradiction'] += 1
+            if is_test: print(f"Node: {island_xy[idx]} = {island_value[idx]} left with capacity {capacity[idx]} it cannot use")
+            clear_worklist()
+            return False
+        if rule > -1:
+            stats['lemma_hits'][LEMMA_NAMES[rule]] += 1
+            if is_test: print(f"Node: {island_xy[idx]} = {island_value[idx]} satisfies lemma {rule}; Building bridges.")
+            if not apply_lemma(idx, rule, i_map, nrow, ncol):
+                clear_worklist()
+                return False
+    return True
+
+def iterative_check(node):
+    # Check existing
     return 0
 
-def update_islands_perpendicular_to_bridge(is_hor, x, y, i_map, nrow, ncol, nodes, bridge_val):
-    disconnected_islands = []
+# Raise the number of bridges between island idx and its neighbour in the given slot to val.
+# Bridges are never taken down here, the search rolls back with undo() instead.
+# Returns False if the bridge closes a group of islands cut off from the rest of the map.
+def build_bridge(idx, slot, val, i_map, nrow, ncol):
+    idx_1 = neighbour[idx, slot]
+    pre_operation_bridge_val = int(bridge_count[idx, idx_1])
+    if (val <= pre_operation_bridge_val):
+        return True
+    (x0, y0) = island_xy[min(idx, idx_1)]
+    (x1, y1) = island_xy[max(idx, idx_1)]
+    if bridge_tuning: print(f"Building {val} bridge(s) from {(x0, y0)} to {(x1, y1)}")
+    stats['bridges_built'] += 1
+    is_hor = (x0 == x1)
     if (is_hor):
-        disconnected_islands = find_vert(x, y, i_map, nrow)
-    else:
-        disconnected_islands = find_hori(x, y, i_map, ncol)
-    # print(disconnected_islands)
-    if len(disconnected_islands) == 2:
-        node_0 = disconnected_islands[0]
-        node_1 = disconnected_islands[1]
-        idx_0 = find_node(node_0, nodes)
-        idx_1 = find_node(node_1, nodes)
-        node0 = nodes[idx_0]
-        node1 = nodes[idx_1]
-        info0 = {'node':node_0, 'position':idx_0}
-        info1 = {'node':node_1, 'position':idx_1}
-        if bridge_val < 0 and (info1 in node0['neighbours'] and info0 in node1['neighbours']):
-            # Removes
-            node0['neighbours'].remove(info1)
-            node1['neighbours'].remove(info0)
-            if bridge_tuning: 
-                print(f"Due to bridge between built, Removed nodes {node_0} and {node_1} from their neighbours list")
-                print(f"\t{node0}\n\t{node1}")
-        elif bridge_val == 0 and (info1 not in node0['neighbours'] and info0 not in node1['neighbours']):
-            node0['neighbours'].append(info1)
-            node1['neighbours'].append(info0)
-            if bridge_tuning: 
-                print(f"Due to bridge between destroyed, Added nodes {node_0} and {node_1} to their neighbours list")
-                print(f"\t{node0}\n\t{node1}")
-            
-def remove_for_max_bridge(node_0, node_1):
-    info_0 = {
-            'node': node_0['xy'],
-            'position': node_0['position']
-    }
-    info_1 = {
-            'node': node_1['xy'],
-            'position': node_1['position']
-    }
-    if (info_0 in node_1['neighbours']):
-        node_1['neighbours'].remove(info_0)
-        if bridge_tuning: print(f"Removed {info_0} from {node_1}")
+        cells = (x0, slice(y0 + 1, y1))
     else:
-        print(f"THIS SHOULDNT HAPPEN.\n\tNeighbours: {node_1}")
-        # quit()
-    if (info_1 in node_0['neighbours']):
-        node_0['neighbours'].remove(info_1)
-        if bridge_tuning: print(f"Removed {info_1} from {node_0}")
-    else:
-        print(f"THIS SHOULDNT HAPPEN.\n\tNeighbours: {node_0}")
-        # quit()
-
-def add_neighbours_back(node_0, node_1, nodes):
-    if bridge_tuning: print(f"======\nAdding neighbours back for\n\t{node_0}\nand\n\t{node_1}\n======")
-    info_0 = {
-        'node':     node_0['xy'],
-        'position': node_0['position'],
-    }
-    info_1 = {
-        'node':     node_1['xy'],
-        'position': node_1['position'],
-    }
-    for bridge in bridges:
-        # bridge not full capacity and node is one end of the bridge
-        if (node_0['xy'] in bridge['ends'] and bridge['val'] > -3):
-            # check if each other is free to add neighbour
-            # obtain other end info
-            other_end_xy = ()
-            if bridge['ends'][0] == node_0['xy']:
-                other_end_xy = bridge['ends'][1]
-            else:
-                other_end_xy = bridge['ends'][0]
-            o_idx = find_node(other_end_xy, nodes)
-            info_o = {
-                'node':     other_end_xy,
-                'position': o_idx,
-            }
-            # if other end is not in node's neighbours
-            if (info_o not in node_0['neighbours']):
-                other_end = nodes[o_idx]
-                # and other end is not completed
-                if other_end['capacity'] > 0 and info_0 not in other_end['neighbours']:
-                    add_helper(info_0, other_end['neighbours'])
-                    add_helper(info_o, node_0['neighbours'])
-        if (node_1['xy'] in bridge['ends'] and bridge['val'] > -3):
-            # check if each other is free to add neighbour
-            # obtain other end info
-            other_end_xy = ()
-            if bridge['ends'][0] == node_1['xy']:
-                other_end_xy = bridge['ends'][1]
-            else:
-                other_end_xy = bridge['ends'][0]
-            o_idx = find_node(other_end_xy, nodes)
-            info_o = {
-                'node':     other_end_xy,
-                'position': o_idx,
-            }
-            # if other end is not in node's neighbours
-            if (info_o not in node_1['neighbours']):
-                other_end = nodes[o_idx]
-                # and other end is not completed
-                if other_end['capacity'] > 0 and info_1 not in other_end['neighbours']:
-                    add_helper(info_1, other_end['neighbours'])
-                    add_helper(info_o, node_1['neighbours'])
-    if (node_0['capacity'] > 0):
-        node_0['is_completed'] = False
-    if (node_1['capacity'] > 0):
-        node_1['is_completed'] = False
-    if bridge_tuning: print(f"======\nAdded neighbours back for\n\t{node_0}\nand\n\t{node_1}\n======")
-
-def add_helper(info, lst):
-    if len(lst) == 0:
-        lst.append(info)
-    else:
-        for idx, neighbour in enumerate(lst):
-            # print(f"In add helpers, neighbour:\n\t{neighbour}\n\t{info}")
-            if (info['position'] < neighbour['position']):
-                lst.insert(idx, info)
-                return
-        lst.append(info)
-
-def remove_current_node_in_neighbours_storage(node):
-    if bridge_tuning: print(f"Removing\n\t{node}\n\tfrom:")
-    self_info = {
-            'node': node['xy'],
-            'position': node['position']
-        }
-    for neighbour in node['neighbours']:
-        neighbour_node = nodes[neighbour['position']]
-        if bridge_tuning: print(neighbour_node['neighbours'])
-        if self_info in neighbour_node['neighbours']:
-            neighbour_node['neighbours'].remove(self_info)
-            if bridge_tuning: print(f"Removed\n\t{node}\nfrom\n\t{neighbour_node}")
-    node['neighbours'] = []
-    node['is_completed'] = True
-        
-def code_bridge(is_hor, value):
-    bridge_code = "-=E|\"#"
-    code_idx = value - 1
-    if (not is_hor):
-        code_idx += 3
-    # print color
-    # if (is_new): print('\x1b[6;30;42m' + bridge_code[code_idx] + '\x1b[0m', end="")
-    # if (is_new): print(bridge_code[code_idx], end="")
-    # else: print(bridge_code[code_idx], end="")
-    print(bridge_code[code_idx], end="")
-
-def print_bridge(x, y, map_val):
-    for bridge in bridges:
-        start = bridge['ends'][0]
-        end = bridge['ends'][1]
-        if (bridge['is_hor']):
-            if (x == start[0] and y > start[1] and y < end[1] and bridge['val'] == map_val):
-                code_bridge(True, -bridge['val'])
-                return True
-        else:
-            if (y == start[1] and x > start[0] and x < end[0] and bridge['val'] == map_val):
-                code_bridge(False, -bridge['val'])
-                return True
-    return False
+        cells = (slice(x0 + 1, x1), y0)
+    trail_set(i_map, cells, -val)
+    # Islands on either side of a new bridge can no longer see each other
+    if (pre_operation_bridge_val == 0):
+        trail_set(bridge_dirn, cells, HORIZONTAL if is_hor else VERTICAL)
+        for edge in edge_conflicts[edge_of[idx, slot]]:
+            block_edge(edge)
+    trail_set(bridge_count, (idx, idx_1), val)
+    trail_set(bridge_count, (idx_1, idx), val)
+    (cap_0, cap_1) = (capacity[idx] - (val - pre_operation_bridge_val), capacity[idx_1] - (val - pre_operation_bridge_val))
+    trail_set(state_hash, 0, state_hash[0] ^ zobrist_capacity[idx][capacity[idx]] ^ zobrist_capacity[idx][cap_0]
+              ^ zobrist_capacity[idx_1][capacity[idx_1]] ^ zobrist_capacity[idx_1][cap_1])
+    trail_set(capacity, idx, cap_0)
+    trail_set(capacity, idx_1, cap_1)
+    # The room of every open slot at either end depends on the capacity of both its islands
+    for end in (idx, idx_1):
+        enqueue(end)
+        for idx_2 in neighbour[end][neighbour_open[end]].tolist():
+            enqueue(idx_2)
+    refresh_island(idx)
+    refresh_island(idx_1)
+    rehash_edge(idx, slot)
+    root = join_components(idx, idx_1)
+    trail_set(component_capacity, root, component_capacity[root] - 2 * (val - pre_operation_bridge_val))
+    if (component_capacity[root] == 0 and component_size[root] < len(capacity)):
+        if bridge_tuning: print(f"Group of {component_size[root]} island(s) closed off from the rest of the map")
+        return False
+    # The isolation bound of slot_room() can only be below MAX_BRIDGE_NUM for a group this low on capacity
+    if (component_capacity[root] <= 2 * MAX_BRIDGE_NUM and component_size[root] < len(capacity)):
+        enqueue_group(root)
+    return True
 
-def print_map(nrow, ncol, i_map):
-    # print("=====================")
-    for r in range(nrow):
-        for c in range(ncol):
-            if (i_map[r,c] >= 0): print(code[i_map[r,c]],end="")
-            else: print_bridge(r,c, i_map[r,c])
-        print()
-    # print("=====================")
+# Queue the islands of a group with open slots, and the islands at the other end of those slots:
+# the rooms of all these slots depend on the capacity left in the group
+def enqueue_group(root):
+    roots = component_parent
+    while True:
+        jumped = roots[roots]
+        if (jumped == roots).all():
+            break
+        roots = jumped
+    members = np.flatnonzero(roots == root)
+    is_open = neighbour_open[members]
+    for idx in members[is_open.any(axis=1)].tolist():
+        enqueue(idx)
+    for idx in neighbour[members][is_open].tolist():
+        enqueue(idx)
+
+# Build a list of ((x0, y0), (x1, y1), count) bridges found by another engine
+def apply_bridges(i_map, nrow, ncol, bridges):
+    for (xy_0, xy_1, count) in bridges:
+        idx = island_at[xy_0]
+        for slot in range(4):
+            if (neighbour[idx, slot] == island_at[xy_1]):
+                build_bridge(idx, slot, count, i_map, nrow, ncol)
 
-def check_exhaustion(nodes):
-    for node in nodes: 
-        if (node['capacity'] != 0): return False
+# Rebuild a search state from the decisions that led to it, as (island, slot, bridges) in the order
+# they were made. Returns False if the state is inconsistent.
+def replay_decisions(decisions, i_map, nrow, ncol):
+    for (idx, slot, val) in decisions:
+        is_connectable = build_bridge(idx, slot, val, i_map, nrow, ncol)
+        decide_slot(idx, slot)
+        if not (is_connectable and propagate(i_map, nrow, ncol, False)):
+            return False
     return True
 
-def check_remaining_nodes_availability(cur_idx):
-    for i in (range(cur_idx, len(nodes))):
-        if nodes[i]['capacity'] > 0 and len(nodes[i]['neighbours']) > 0:
-            return True
-    return False
+# The bridges built so far as ((x0, y0), (x1, y1), count), as taken by apply_bridges()
+def list_bridges():
+    bridges = []
+    for (idx_0, idx_1) in edge_ends:
+        if bridge_count[idx_0, idx_1] > 0:
+            bridges.append((tuple(int(v) for v in island_xy[idx_0]),
+                            tuple(int(v) for v in island_xy[idx_1]), int(bridge_count[idx_0, idx_1])))
+    return bridges
+
+def block_edge(edge):
+    (idx_0, idx_1) = edge_ends[edge]
+    slot = EAST if island_xy[idx_0, 0] == island_xy[idx_1, 0] else SOUTH
+    trail_set(crossings, (idx_0, slot), crossings[idx_0, slot] + 1)
+    trail_set(crossings, (idx_1, opposite(slot)), crossings[idx_1, opposite(slot)] + 1)
+    refresh_slot(idx_0, slot)
+    if bridge_tuning: print(f"Slot between {island_xy[idx_0]} and {island_xy[idx_1]} crossed by {crossings[idx_0, slot]} bridge(s)")
+
+# Render the map as text: every cell is looked up in glyphs at once and the whole map is
+# written with a single write
+def render_map(nrow, ncol, i_map):
+    cell = i_map[:nrow, :ncol]
+    glyph_idx = np.where(cell >= 0, cell, len(code) - 1 - cell)
+    glyph_idx = np.where(bridge_dirn[:nrow, :ncol] == VERTICAL, glyph_idx + 3, glyph_idx)
+    text = np.full((nrow, ncol + 1), ord('\n'), dtype=np.uint8)
+    text[:, :ncol] = glyphs[glyph_idx]
+    return text.tobytes().decode()
+
+def print_map(nrow, ncol, i_map):
+    sys.stdout.write(render_map(nrow, ncol, i_map))
+
+# True once every island (of the given ones, if any) used up its capacity
+def check_exhaustion(islands=None):
+    return not (capacity.any() if islands is None else capacity[islands].any())
+
+# Branching heuristics: each returns the (island, slot) the search decides next among the open slots
+# flagged in open_mask (neighbour_open, or part of it), None if there are none.
+# scan:         first open slot in scan order
+def branch_scan(open_mask):
+    flat = np.flatnonzero(open_mask)
+    if (len(flat) == 0):
+        return None
+    return divmod(int(flat[0]), 4)
+
+# scan-reverse: last open slot in scan order
+def branch_scan_reverse(open_mask):
+    flat = np.flatnonzero(open_mask)
+    if (len(flat) == 0):
+        return None
+    return divmod(int(flat[-1]), 4)
+
+# Open slots of every island, and for each island the open slots of its open neighbours
+# (the number of undecided slots it constrains, used to break ties)
+def open_counts(open_mask):
+    k = open_mask.sum(axis=1)
+    degree = np.where(open_mask, k[neighbour], 0).sum(axis=1)
+    return k, degree
+
+# Branch on the open slot of the island whose neighbour has the fewest open slots left
+def most_constrained_slot(idx, k, open_mask):
+    best = -1
+    for slot in range(4):
+        if open_mask[idx, slot] and (best < 0 or k[neighbour[idx, slot]] < k[neighbour[idx, best]]):
+            best = slot
+    return (idx, best)
+
+# Number of values (amounts of bridges) every open slot can still take, 0 for closed slots
+def slot_domains(open_mask):
+    count = bridge_count[np.arange(len(capacity))[:, None], neighbour]
+    room = np.minimum(np.minimum(MAX_BRIDGE_NUM - count, capacity[:, None]), capacity[neighbour])
+    return np.where(open_mask, room.astype(np.int32) + 1, 0)
+
+# mrv:          open slot with the fewest values left (minimum remaining values), ties in scan order
+def branch_mrv(open_mask):
+    dom = slot_domains(open_mask)
+    if not dom.any():
+        return None
+    key = np.where(dom > 0, dom, MAX_BRIDGE_NUM + 2)
+    return divmod(int(np.argmin(key)), 4)
+
+# mrv-random:   as mrv, ties broken at random
+def branch_mrv_random(open_mask):
+    dom = slot_domains(open_mask)
+    if not dom.any():
+        return None
+    key = np.where(dom > 0, dom, MAX_BRIDGE_NUM + 2)
+    ties = np.flatnonzero(key == key.min())
+    return divmod(int(ties[rng.integers(len(ties))]), 4)
+
+# mrv-degree:   as mrv, ties to the island with the highest degree
+def branch_mrv_degree(open_mask):
+    dom = slot_domains(open_mask)
+    if not dom.any():
+        return None
+    k, degree = open_counts(open_mask)
+    key = np.where(dom > 0, dom * 64 - degree[:, None], (MAX_BRIDGE_NUM + 2) * 64)
+    return divmod(int(np.argmin(key)), 4)
+
+# capacity:     island with the highest capacity left per open slot, ties to the highest degree
+def branch_capacity(open_mask):
+    k, degree = open_counts(open_mask)
+    if not k.any():
+        return None
+    key = np.where(k > 0, capacity / np.maximum(k, 1) + degree / 64.0, -1.0)
+    return most_constrained_slot(int(np.argmax(key)), k, open_mask)
+
+BRANCHING_HEURISTICS = {
+    'scan':         branch_scan,
+    'scan-reverse': branch_scan_reverse,
+    'mrv':          branch_mrv,
+    'mrv-random':   branch_mrv_random,
+    'mrv-degree':   branch_mrv_degree,
+    'capacity':     branch_capacity,
+}
+# Solved the most of a 10x10 - 25x25 bridgen corpus within 15s per map
+DEFAULT_BRANCHING = 'mrv'
+
 #   nrow and ncol included for building bridges
-    # Base Case:  All Exhausted => True
-    #             All islands are traversedd but not exhausted => return False
-    # Initialisation:
-    #     Case:   Current node exhausted is exhausted => return recur(next node)
-    #             If it's the first time iterating the current node (n_idx == -1), set it to be the latest neighbour for iteration
-    #             If we have iterated all neighbours  => return recur(next node)
-    #     ** Due to the behaviour of python list iteration and the nature of the operation of removing element from an array,
-    #     ** For each node, we start trialing with its last available neighbour then iterate towards the first neighbour.
+    # An iterative DFS over an explicit stack of choice points, one per slot being decided:
+    #     [island, slot, next bridge value to try, value to stop at, trail mark, value built, state hash,
+    #      solutions found before it]
+    # Base Case:  No open slot left => solved if every island is exhausted
+    #             With on_solution, a solution is passed on instead and, unless on_solution() returns
+    #             True, counted and treated as a dead end
+    #             State in the nogoods table => dead end
+    #             With probe, probe_slots() finds a slot none of whose values work => dead end
+    #             Dead end => roll back to the deepest choice point with values left and try its next value;
+    #             the choice points running out of values on the way are added to the nogoods table
+    #             (unless some solution was found under them)
     # Iteration:
-    #     Case:   Avoid downgrading lemma bridges.
-    #             * This shouldn't happen, but avoid building from an exhausted island, or to an exhausted neighbour
-    #             Build bridge with val = b, valid by (if (recur(next neighbour)): return True)
-                
-        
-def recur(i_map, nodes, bridges, node_idx, neighbour_idx, is_test, nrow, ncol, non_reduce, stack_count):
-    # Check returning conditions
-    if is_test: print(f"Enter #{stack_count} recursive at node index [{node_idx}] at its [{neighbour_idx}] th neighbour")
-    # if is_test: print_map(nrow, ncol, i_map)
-    if check_exhaustion(nodes): return True
-    if node_idx == len(nodes):
-        # All nodes traversed, but not exhausted -> no solution found
-        if is_test: print(f"{stack_count} Traversed all nodes and not succeeded. Current Status:")
-        if is_test: print_map(nrow, ncol, i_map)
-        return False
-    # Add an additional check for nodes after the current idx, whether it's still meaningful to iterate based on the allocation
-    # Probably only useful for forward search? Should get something for backwards search as well
-    if not check_remaining_nodes_availability(node_idx):
-        return False
-    
-    
-    node = nodes[node_idx]
-    if is_test: print(f"Stack #{stack_count}, node#{node['position']}: {node}")
-    if node['capacity'] == 0:
-        # Early end recursive due to current stack exhausts the current node
-        if recur(i_map, nodes, bridges, node_idx + 1, -1, is_test, nrow, ncol, non_reduce, stack_count + 1):
-            return True
-    neighbours = node['neighbours']
-    # This indicates the current allocation of resource leaves one node unsatisfied. Thus this allocation must be wrong 
-    if is_test: print(f"Stack #{stack_count}, neighbours: {neighbours}")
-    if (len(neighbours) == 0 and node['capacity'] > 0):
-        if is_test: print(f"THIS SHOULD only come out in invalid tests, {node}")
-        return False
-    elif (len(neighbours) == 0 and node['capacity'] == 0):
-        if is_test: print(F"Stack#{stack_count} satisfied node#{node['position']}: {node} during iteration call")
-        # Dont return straightaway because earlier stack might not be satisfied, and we need to 
-        if (recur(i_map, nodes, bridges, node_idx + 1, -1, is_test, nrow, ncol, non_reduce, stack_count + 1)): return True
-    if neighbour_idx == -1:
-        neighbour_idx = len(neighbours)
-    # Bridge established in iteration call satisfied multiple neighbours
-    while (neighbour_idx > len(neighbours)):
-        neighbour_idx -= 1
-    if neighbour_idx == 0:
-        # Indicate that current neighbour has all been iterated.
-        return recur(i_map, nodes, bridges, node_idx + 1, -1, is_test, nrow, ncol, non_reduce, stack_count + 1)
-    # if is_test: print(f"NIDX #{stack_count}, {neighbour_idx}")
-    neighbour = neighbours[neighbour_idx - 1]
-    if is_test: print(f"Stack #{stack_count}, neighbour#{neighbour_idx}: {neighbour}")
-    
-    # If no available neighbour, return False?
-
-    # Only build forward
-    if is_test: print(f"Recursively checking #{stack_count} at node index [{node_idx}] at its [{neighbour_idx - 1}] th neighbour\n\tNode: {nodes[node_idx]}")
-    # Trying forward to see if it works for sample 10 * 20
-    # if (neighbour['position'] < node['position']):
-    # Backward
-    if (node['position'] > neighbour['position']):
-        for build_bridge_val in reversed(range(-3, 0)):
-            bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-            neighbour_node = nodes[neighbour['position']]
-            # Try Build Bridge Block
-            # Avoid downgrading lemma bridge values
-            if (bridge_idx != -1 and bridge_idx < non_reduce):
-                if (bridges[bridge_idx]['lemma_val'] <= build_bridge_val):
-                    if is_test: print(f"Failed Trying to {build_bridge_val} build(s) at #{stack_count} stack since {bridge_idx} < {non_reduce}.")
-                    pass
-                else:
-                    if (neighbour_node['capacity'] == 0 or node['capacity'] == 0):
-                        if (recur(i_map, nodes, bridges, node_idx + 1, -1, is_test, nrow, ncol, non_reduce, stack_count + 1)): return True
-                    else:
-                        if (is_test): print(f"Stack #{stack_count} Upgrading lemma bridge {bridges[bridge_idx]}")
-                        # build_bridge(node['xy'], neighbour['node'], node_idx, i_map, 0, nrow, ncol, nodes, bridges)
-                        # build_bridge(node['xy'], neighbour['node'], node_idx, i_map, bridges[bridge_idx]['lemma_val'], nrow, ncol, nodes, bridges)
-                        build_bridge(node['xy'], neighbour['node'], node_idx, i_map, build_bridge_val, nrow, ncol, nodes, bridges)
-                        if (is_test): 
-                            print_map(nrow, ncol, i_map)
-                            print(f"Built {int(-build_bridge_val)} bridge from {node['xy']} to {neighbour['node']}\n==================================================================\n")
+    #     Case:   Pick the next slot with the branching heuristic, push a choice point trying every amount
+    #             of bridges the slot can still take, from the most down to the lemma value
+    #             (or upwards if ascending), and close the slot.
+    #             The state is rolled back with the undo trail between amounts.
+    #     Case:   With decompose, if the open slots fell apart into independent components, solve them
+    #             one at a time with search_components() instead: either that solves the rest of the map,
+    #             or the node is a dead end.
+    # Returns None if node_limit choices were tried without an answer.
+    # split(stack, step), if given, is called before every step and may hand untried values of the
+    # choice points to someone else by moving their next value to the stop value.
+    # region, if given, is a (slots, islands) pair from independent_components(): only those slots are
+    # decided and only those islands need to be exhausted. split_root=False skips the decomposition of
+    # the first node (search_components() falling back to a search of the whole region).
+    # probe is the number of slots probe_slots() tries out at every node before branching, 0 for none.
+    # on_solution, if given, is called at every solution (left built on the map) to enumerate them:
+    # search() then returns True if on_solution() did, else False once every solution was passed on.
+    # Components are not split off while enumerating, their solutions would have to be combined.
+def search(i_map, is_test, nrow, ncol, branching=DEFAULT_BRANCHING, ascending=False, node_limit=None, split=None,
+           region=None, decompose=False, split_root=True, probe=0, on_solution=None):
+    pick_slot = BRANCHING_HEURISTICS[branching]
+    (region_slots, region_islands) = (None, None) if region is None else region
+    step = 1 if ascending else -1
+    stack = []
+    is_consistent = True
+    decompose = decompose and on_solution is None
+    may_split = decompose and split_root
+    found = 0
+    while True:
+        if split is not None:
+            split(stack, step)
+        position = None
+        if (is_consistent and state_hash[0] in nogoods):
+            nogoods.move_to_end(state_hash[0])
+            stats['nogood_hits'] += 1
+        elif (is_consistent):
+            node_hash = state_hash[0]
+            if (probe and not probe_slots(i_map, nrow, ncol, region_slots, probe)):
+                add_nogood(node_hash)
             else:
-                # Neighbour exhausted by bridge building from previous iteration
-                # Since current neighbour is exhausted => go to next neighbour
-                # Neighbours all iterated (i.e. a bridge from the current island to all neighbours with at least 0 bridges)
-                # If current node not exhausted, try to build bridge with the next available neighbour
-                if (neighbour_node['capacity'] == 0 or node['capacity'] == 0):
-                    # During iteration, current neighbour exhausted or node exhausted
-                    #   => recur on next node
-                    if (recur(i_map, nodes, bridges, node_idx + 1, -1, is_test, nrow, ncol, non_reduce, stack_count + 1)): 
+                position = pick_slot(neighbour_open if region is None else neighbour_open & region_slots)
+                if (position is None and check_exhaustion(region_islands)):
+                    if (on_solution is None or on_solution()):
                         return True
-                # Node exhausted from previous iteration on neighbours => go to next node
-                else:
-                    if is_test: print(f"Stack #{stack_count} Trying to {-build_bridge_val} build(s) at #{stack_count} stack from {node['xy']} to {neighbour['node']}.")
-                    build_bridge(node['xy'], neighbour['node'], node_idx, i_map, build_bridge_val, nrow, ncol, nodes, bridges)
-                    if (is_test): 
-                        print_map(nrow, ncol, i_map)
-                        print(f"Built {int(-build_bridge_val)} bridge from {node['xy']} to {neighbour['node']}\n==================================================================\n")
-            # Bridges built, See if this works
-            if (recur(i_map, nodes, bridges, node_idx, neighbour_idx - 1, is_test, nrow, ncol, non_reduce, stack_count + 1)): return True
-            elif build_bridge_val == -3:
-                build_bridge(node['xy'], neighbour['node'], node_idx, i_map, 0, nrow, ncol, nodes, bridges)
-                if (bridges[bridge_idx]['lemma_val'] < 0):
-                    build_bridge(node['xy'], neighbour['node'], node_idx, i_map, bridges[bridge_idx]['lemma_val'], nrow, ncol, nodes, bridges)
-    else:
-        if (recur(i_map, nodes, bridges, node_idx, neighbour_idx - 1, is_test, nrow, ncol, non_reduce, stack_count + 1)): return True
-    if (is_test): print(f"Stack #{stack_count} failed [{node_idx}] at its [{neighbour_idx}] th neighbour")
-    return False
+                    found += 1
+        if (position is not None and may_split):
+            regions = independent_components(region_slots)
+            if (len(regions) > 1):
+                is_solved = search_components(i_map, is_test, nrow, ncol, regions, region, branching, ascending, node_limit,
+                                              probe)
+                if (is_solved is not False):
+                    return is_solved
+                add_nogood(state_hash[0])
+                position = None
+        may_split = decompose
+        if (node_limit is not None and stats['nodes'] >= node_limit):
+            return None
+        if (position is None):
+            while stack and stack[-1][2] == stack[-1][3]:
+                # Values handed to split() are searched elsewhere, the choice point has not failed
+                if (split is None and stack[-1][7] == found):
+                    add_nogood(stack[-1][6])
+                stack.pop()
+            if not stack:
+                return False
+            stats['backtracks'] += 1
+            if is_test: print(f"Dead end, back to choice point #{len(stack)}: {stack[-1]}")
+        else:
+            (idx, slot) = position
+            idx_1 = neighbour[idx, slot]
+            pre_operation_bridge_val = int(bridge_count[idx, idx_1])
+            most = pre_operation_bridge_val + slot_room(idx, slot)
+            if (ascending):
+                stack.append([idx, slot, pre_operation_bridge_val, most + 1, trail_mark(), None, state_hash[0], found])
+            else:
+                stack.append([idx, slot, most, pre_operation_bridge_val - 1, trail_mark(), None, state_hash[0], found])
+            if (len(stack) > stats['max_depth']):
+                stats['max_depth'] = len(stack)
+        choice = stack[-1]
+        (idx, slot, build_bridge_val, _, mark, _, _, _) = choice
+        undo(mark)
+        choice[2] += step
+        choice[5] = build_bridge_val
+        stats['nodes'] += 1
+        is_connectable = build_bridge(idx, slot, build_bridge_val, i_map, nrow, ncol)
+        decide_slot(idx, slot)
+        if (is_test):
+            print_map(nrow, ncol, i_map)
+            print(f"Choice point #{len(stack)}: built {build_bridge_val} bridge from {island_xy[idx]} to {island_xy[neighbour[idx, slot]]}\n==================================================================\n")
+        # Re-apply the lemmas to everything the new bridge changed before deciding the next slot
+        is_consistent = is_connectable and propagate(i_map, nrow, ncol, is_test)
 
-# only_map = False
-def main():
-    # if (len(sys.argv)) == 2:
-    #     # Write to file
-    #     pass
-    # else:
-    #     only_map = True
-    nrow, ncol, i_map = scan_map()
-    # Get islands/nodes
-    for r in range(nrow):
-        for c in range(ncol):
-            map_v = i_map[r,c]
-            if(map_v > 0):
-                nodes.append({
-                    'xy': (r,c),
-                    'value':    map_v,
-                    'capacity': map_v,
-                    'neighbours': find_neighbours((r, c), i_map, nrow, ncol),
-                    # 'neighbour_of': [],
-                    'is_completed': False,
-                    'position': len(nodes),
-                    # 'bridges': []
-                })
-                # cur_node = nodes[len(nodes) - 1]
-    # For all nodes, give them easier access to their neighbours position
-    for node_idx, node in enumerate(nodes):
-        new = []
-        neighbours = node['neighbours']
-        for neighbour in neighbours:
-            neighbour_idx = find_node(neighbour, nodes)
-            new.append({
-                'node': neighbour,
-                'position': neighbour_idx,
-            })
-            # nodes[neighbour_idx]['neighbour_of'].append({
-            #     'node': node['xy'],
-            #     'position': node_idx,
-            # })
-        node['neighbours'] = []
-        for info in new:
-            add_helper(info, node['neighbours'])
-        
-    
-    # for node in nodes:
-    #     print(node)
-    tuning = False
+# Failed-literal probing: try out every value of the count open slots (of the given (n, 4) table of
+# slots, if any) with the fewest values, each followed by propagate() and rolled back. A value is
+# ruled out if that fails or lands on a state in the nogoods table. A slot left with a single value
+# is built and closed, and the lowest value left is built on a slot that lost its lowest values (the
+# highest ones cannot be taken off a slot); the slots are probed again after every such deduction.
+# Returns False if some slot has no value left.
+def probe_slots(i_map, nrow, ncol, within, count):
+    is_narrowed = True
+    while (is_narrowed):
+        is_narrowed = False
+        dom = slot_domains(neighbour_open if within is None else neighbour_open & within)
+        # Every slot once, from its first island
+        dom[:, [NORTH, WEST]] = 0
+        flat = np.flatnonzero(dom)
+        for position in flat[np.argsort(dom.ravel()[flat], kind='stable')][:count].tolist():
+            (idx, slot) = divmod(position, 4)
+            if not neighbour_open[idx, slot]:
+                continue
+            idx_1 = neighbour[idx, slot]
+            low = int(bridge_count[idx, idx_1])
+            values = []
+            for val in range(low, low + slot_room(idx, slot) + 1):
+                mark = trail_mark()
+                stats['probes'] += 1
+                is_connectable = build_bridge(idx, slot, val, i_map, nrow, ncol)
+                decide_slot(idx, slot)
+                if (is_connectable and propagate(i_map, nrow, ncol, False) and state_hash[0] not in nogoods):
+                    values.append(val)
+                undo(mark)
+            if not values:
+                return False
+            if (len(values) == 1 or values[0] > low):
+                stats['probe_hits'] += 1
+                is_narrowed = True
+                is_connectable = build_bridge(idx, slot, values[0], i_map, nrow, ncol)
+                if (len(values) == 1):
+                    decide_slot(idx, slot)
+                if not (is_connectable and propagate(i_map, nrow, ncol, False)):
+                    return False
+    return True
+
+# Split the open slots (of the given (n, 4) table of slots, if any) into groups that cannot affect each
+# other: two open slots are in the same group if they share an island or their bridges would cross.
+# Returns a (slots, islands) region per group, slots flagged on both ends in a (n, 4) table and the
+# islands they join as an index array.
+def independent_components(within=None):
+    is_open = neighbour_open[edge_ends[:, 0], edge_slot]
+    if within is not None:
+        is_open &= within[edge_ends[:, 0], edge_slot]
+    open_edges = np.flatnonzero(is_open)
+    crossing = crossing_pairs[is_open[crossing_pairs[:, 0]] & is_open[crossing_pairs[:, 1]]]
+    # Islands to put in one group: both ends of an open edge, and the first ends of two open edges that cross
+    a = np.concatenate([edge_ends[open_edges, 0], edge_ends[crossing[:, 0], 0]])
+    b = np.concatenate([edge_ends[open_edges, 1], edge_ends[crossing[:, 1], 0]])
+    # Label every island with the smallest island of its group: hook the label of one end of every pair
+    # onto the smaller of both labels, then follow the labels down to the ones labelling themselves
+    label = np.arange(len(capacity))
+    while True:
+        (label_a, label_b) = (label[a], label[b])
+        if (label_a == label_b).all():
+            break
+        low = np.minimum(label_a, label_b)
+        np.minimum.at(label, label_a, low)
+        np.minimum.at(label, label_b, low)
+        while True:
+            jumped = label[label]
+            if (jumped == label).all():
+                break
+            label = jumped
+    group = label[edge_ends[open_edges, 0]]
+    regions = []
+    for root in np.flatnonzero(np.bincount(group, minlength=len(capacity))):
+        edges = open_edges[group == root]
+        slots = np.zeros(neighbour.shape, dtype=bool)
+        (ends, slot) = (edge_ends[edges], edge_slot[edges])
+        slots[ends[:, 0], slot] = True
+        slots[ends[:, 1], opposite(slot)] = True
+        regions.append((slots, np.flatnonzero(slots.any(axis=1))))
+    return regions
+
+# Solve independent components of the open slots one at a time, smallest first, each from the
+# current state, so that their search spaces add up instead of multiplying. A component without a
+# solution of its own makes the whole node a dead end. Connectivity is the one thing that spans
+# components: the solutions are merged, and if that closes off a group of islands (the components'
+# solutions cut the map apart between them) the region is searched again as a whole.
+# Returns True with the merged solution built, False, or None if the node limit was hit.
+def search_components(i_map, is_test, nrow, ncol, regions, region=None, branching=DEFAULT_BRANCHING,
+                      ascending=False, node_limit=None, probe=0):
+    stats['splits'] += 1
+    base = trail_mark()
+    solution = []
+    for part in sorted(regions, key=lambda r: len(r[1])):
+        is_solved = search(i_map, is_test, nrow, ncol, branching, ascending, node_limit, region=part, decompose=True,
+                           probe=probe)
+        if not is_solved:
+            undo(base)
+            return is_solved
+        for (idx, slot) in np.argwhere(part[0][:, [EAST, SOUTH]]).tolist():
+            slot = EAST if slot == 0 else SOUTH
+            solution.append((idx, slot, int(bridge_count[idx, neighbour[idx, slot]])))
+        undo(base)
+    is_connected = True
+    for (idx, slot, val) in solution:
+        is_connected = build_bridge(idx, slot, val, i_map, nrow, ncol) and is_connected
+    if (is_connected and check_exhaustion(None if region is None else region[1])):
+        return True
+    if is_test: print("Component solutions cut the map apart, searching them as a whole")
+    undo(base)
+    return search(i_map, is_test, nrow, ncol, branching, ascending, node_limit, region=region, decompose=True,
+                  split_root=False, probe=probe)
+
+# Load the map and solve it with the chosen engine, leaving the bridges on i_map.
+# Returns True if a solution was found, None if the dfs gave up after node_limit choices.
+# The counters of the solve are left in stats, and passed to on_stats if given.
+def solve_map(i_map, nrow, ncol, engine='dfs', branching=DEFAULT_BRANCHING, tuning=False,
+              ascending=False, node_limit=None, seed=None, on_stats=None, probe=0):
+    global stats, rng
+    stats = new_stats()
+    if seed is not None:
+        rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    load_islands(i_map, nrow, ncol)
+
+    if (engine == 'sat'):
+        import hashi_sat
+        bridges = hashi_sat.solve_sat(i_map, nrow, ncol)
+        stats['nodes'] = hashi_sat.decisions
+        stats['backtracks'] = hashi_sat.conflicts
+        is_solved = bridges is not None
+        if (is_solved):
+            apply_bridges(i_map, nrow, ncol, bridges)
+        stats['time']['search'] = time.perf_counter() - start
+        if on_stats is not None:
+            on_stats(stats)
+        return is_solved
 
-    # print(f"Initialisation complete:")
-    # for node in nodes:
-    #     print(node)
     # For all nodes, try apply the lemma to link islands that must be connected before applying other search strategies
-    init_complete = False
-    check_lemma_ = True
-    lmc = -1
-    if (check_lemma_):
-        if tuning: print("Start checking lemma")
-        while (not init_complete):
-            lmc = lmc + 1
-            # if (lmc == 5): break
-            init_complete = True
-            if tuning: print(f"\n\nIterating\n\n")
-            for idx, node in enumerate(nodes):
-                # May also want to update check_lemma to iterate using the list of dict
-                if check_lemma(node) > -1:
-                    if tuning: print(f"Node: {node['xy']} = {node['value']} satisfies lemma {check_lemma(node)}; {node} Building bridges.")
-                    init_complete = False
-                    neighbours = node['neighbours']
-                    if len(neighbours) == 1:
-                        bridge_idx = bridge_contains(node['xy'], neighbours[0]['node'], bridges)
-                        if (bridge_idx > -1):
-                            # build_bridge(node['xy'], neighbours[0]['node'], idx, i_map, 0, nrow, ncol, nodes, bridges)
-                            new_lv = -node['capacity']+bridges[bridge_idx]['val']
-                            if tuning: print(f"new_lv = {new_lv}")
-                            build_bridge(node['xy'], neighbours[0]['node'], idx, i_map, new_lv, nrow, ncol, nodes, bridges)
-                            bridges[bridge_idx]['lemma_val'] = new_lv
-                        else:
-                            build_bridge(node['xy'], neighbours[0]['node'], idx, i_map, -node['capacity'], nrow, ncol, nodes, bridges)
-                    elif (node['capacity'] == (len(node['neighbours']) * MAX_BRIDGE_NUM)):
-                        if tuning: print(f"FOUND {node['value']} at {node['xy']} with neighbours: {neighbours}")
-                        for i in reversed(range(0, len(node['neighbours']))):
-                            neighbour = neighbours[i]
-                            build_bridge(node['xy'], neighbour['node'], idx, i_map, -3, nrow, ncol, nodes, bridges)
-                            bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                            bridge = bridges[bridge_idx]
-                            bridge['lemma_val'] = -3
-                            if node['value'] == 12:
-                                print_map(nrow, ncol, i_map)
-                                print()
-                    # elif (node['value'] == (len(node['neighbours']) * MAX_BRIDGE_NUM)):
-                    #     for neighbour in neighbours:
-                    #         bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                    #         build_bridge(node['xy'], neighbour['node'], idx, i_map, -3, nrow, ncol, nodes, bridges)
-                    else:
-                        available_val = node['capacity']
-                        # Case for the right most 8 on the 6th row (5, 16)
-                        non_exhausted_bridge_val = 0
-                        neighbours_capacity_excluding_cur_bridges = []
-                        built_bridges = []
-                        for neighbour in neighbours:
-                            bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                            if (bridge_idx > -1):
-                                b_val = bridges[bridge_idx]['val']
-                                non_exhausted_bridge_val += b_val
-                                n = nodes[neighbour['position']]
-                                neighbours_capacity_excluding_cur_bridges.append({
-                                    'node': neighbour['node'],
-                                    'capa': n['capacity'] - b_val,
-                                })
-                        tmp = available_val - non_exhausted_bridge_val
-                        if tmp == len(neighbours) * MAX_BRIDGE_NUM:
-                            # WE SHOULD BE ABLE TO BUILD MULTIPLE 3 BRIDGES HERE
-                            if tuning: print("CASE AAA")
-                            while (tmp > 3):
-                                tmp -= 3
-                            for neighbour in neighbours_capacity_excluding_cur_bridges:
-                                build_val = -tmp
-                                if tuning: print(f"Try to build {tmp} or {neighbour['capa']} bridges from {node['xy']} to {neighbour['node']}")
-                                if neighbour['capa'] < tmp: build_val = -neighbour['capa']
-                                build_bridge(node['xy'], neighbour['node'], idx, i_map, build_val, nrow, ncol, nodes, bridges)
-                                bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                                bridge = bridges[bridge_idx]
-                                if (bridge['lemma_val'] > build_val): bridge['lemma_val'] = build_val
-                        elif tmp < len(neighbours) * MAX_BRIDGE_NUM:
-                            if tuning: print("CASE BBB")
-                            while (tmp > 3):
-                                tmp -= 3
-                            for neighbour in neighbours_capacity_excluding_cur_bridges:
-                                build_val = -tmp
-                                if tuning: print(f"Try to build {tmp} or {neighbour['capa']} bridges from {node['xy']} to {neighbour['node']}")
-                                if neighbour['capa'] < tmp: build_val = -neighbour['capa']
-                                build_bridge(node['xy'], neighbour['node'], idx, i_map, build_val, nrow, ncol, nodes, bridges)
-                                bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                                bridge = bridges[bridge_idx]
-                                if (bridge['lemma_val'] > build_val): bridge['lemma_val'] = build_val
-                        else:
-                            if tuning: print(f"THIS SHOULDNT HAPPEN. CHECK WHY LEMMA WORKS")
-                            
-                        while (available_val > 3):
-                            available_val -= 3
-                        for neighbour in neighbours:
-                            if tuning: print("CASE CCC")
-                            build_val = -available_val
-                            n = nodes[neighbour['position']]
-                            if tuning: print(f"Try to build {available_val} or {n['capacity']} bridges from {node['xy']} to {neighbour['node']}")
-                            if n['capacity'] < available_val: build_val = -n['capacity']
-                            build_bridge(node['xy'], neighbour['node'], idx, i_map, build_val, nrow, ncol, nodes, bridges)
-                            bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                            bridge = bridges[bridge_idx]
-                            if (bridge['lemma_val'] > build_val): bridge['lemma_val'] = build_val
-                
-                
-            if tuning:
-                print(f"Lemma iteration {lmc}")
-                print_map(nrow, ncol, i_map)
-                print()
-        # Post-Lemma Pre-DFS map result
-        if tuning:
-            print("finished checking lemma")
-            # return 0
-            print_map(nrow, ncol, i_map)
-            print()
-    
-    for node_idx, node in enumerate(nodes):
-        neighbours = node['neighbours']
-        for neighbour in neighbours:
-            if (bridge_contains(node['xy'], neighbour['node'], bridges) < 0):
-                build_bridge(node['xy'], neighbour['node'], node_idx, i_map, 0, nrow, ncol, nodes, bridges)
+    if tuning: print("Start checking lemma")
+    is_solvable = propagate(i_map, nrow, ncol, tuning)
+    # Post-Lemma Pre-DFS map result
+    if tuning:
+        print("finished checking lemma")
+        print_map(nrow, ncol, i_map)
+        print()
+
+    lemma_done = time.perf_counter()
+    stats['time']['lemma'] = lemma_done - start
+    lemma_built = stats['bridges_built']
+
+    # Lemma bridges are never taken down, so the search starts with an empty trail
+    del trail[:]
     # Start dfs brutal search
-    # print(f"dfs nodes: {dfs_nodes}\ndfs bridges: {dfs_bridges}")
-    sys.setrecursionlimit(1000)
-    # solve(i_map, nodes, bridges, nrow, ncol, 0, 0, tuning)
     if tuning: print("INITIALISATION COMPLETE")
-    recur(i_map, nodes, bridges, 0, -1, tuning, nrow, ncol, len(bridges), 0)
-    print_map(nrow, ncol, i_map)
-    # if (solve(i_map, dfs_nodes, dfs_bridges, nrow, ncol)):
-    #     print("SUCCESS")
+    is_solved = False
+    if (is_solvable):
+        is_solved = search(i_map, tuning, nrow, ncol, branching, ascending, node_limit, decompose=True, probe=probe)
+    stats['time']['search'] = time.perf_counter() - lemma_done
+    # Every bridge the search built is either still on the trail (bridge_count is written in both
+    # directions) or was undone
+    on_trail = sum(1 for (array, _, _) in trail if array is bridge_count) // 2
+    stats['bridges_undone'] = stats['bridges_built'] - lemma_built - on_trail
+    if on_stats is not None:
+        on_stats(stats)
+    return is_solved
+
+# Count the solutions of the map, stopping at limit of them (None for all): the lemma pass is run
+# once and one search enumerates the solutions, sharing everything above them, including the
+# nogoods found on the way. Returns the number of solutions found (limit meaning at least that many),
+# or None if the search gave up after node_limit choices; the bridges of the first keep solutions are
+# left in solutions. The counters of the count are left in stats, 'solutions' included.
+def count_solutions(i_map, nrow, ncol, limit=2, branching=DEFAULT_BRANCHING, node_limit=None, probe=0, keep=2,
+                    solutions=None):
+    global stats
+    stats = new_stats()
+    start = time.perf_counter()
+    load_islands(i_map, nrow, ncol)
+    is_solvable = propagate(i_map, nrow, ncol, False)
+    lemma_done = time.perf_counter()
+    stats['time']['lemma'] = lemma_done - start
+    del trail[:]
+    found = [0]
+    def on_solution():
+        if (solutions is not None and found[0] < keep):
+            solutions.append(list_bridges())
+        found[0] += 1
+        return found[0] == limit
+    result = False
+    if (is_solvable):
+        result = search(i_map, False, nrow, ncol, branching, node_limit=node_limit, probe=probe, on_solution=on_solution)
+    stats['time']['search'] = time.perf_counter() - lemma_done
+    stats['solutions'] = found[0]
+    return None if result is None else found[0]
+
+# only_map = False
+def main():
+    parser = argparse.ArgumentParser(description="Solve a hashi puzzle read from stdin.")
+    parser.add_argument('--branching', choices=list(BRANCHING_HEURISTICS), default=DEFAULT_BRANCHING,
+                        help=f"order in which the search decides slots (default: {DEFAULT_BRANCHING})")
+    parser.add_argument('--engine', choices=['dfs', 'sat'], default='dfs',
+                        help="dfs: lemma pass and backtracking search; sat: CNF encoding solved by hashi_sat")
+    parser.add_argument('--probe', metavar='N', type=int, default=0,
+                        help="before every branch, try out the values of the N slots with the fewest values (default: 0, off)")
+    parser.add_argument('--count', metavar='N', type=int,
+                        help="count the solutions instead (dfs only), stopping at N (2 for a uniqueness check, 0 for all);"
+                             " the exit status is 0 if there is exactly one")
+    parser.add_argument('--certificate', metavar='FILE',
+                        help="also write the bridges of the solution as JSON, to be checked by hashi_verify.py")
+    parser.add_argument('--cache', metavar='DIR', nargs='?', const='',
+                        help="look the map up in (and add it to) the solution cache of hashi_cache.py (default: ~/.cache/hashi)")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="write the solver counters and phase timings as JSON at exit ('-' for stderr)")
+    args = parser.parse_args()
+    if (args.count is not None and args.engine != 'dfs'):
+        parser.error("--count only works with --engine dfs")
+    start = time.perf_counter()
+    try:
+        nrow, ncol, i_map = scan_map()
+    except ValueError as e:
+        print(f"hashi: {e}", file=sys.stderr)
+        return 1
+    parse_time = time.perf_counter() - start
+    tuning = False
+
+    if (args.count is not None):
+        limit = args.count or None
+        count = count_solutions(i_map, nrow, ncol, limit, args.branching, probe=args.probe)
+        stats['time']['parse'] = parse_time
+        elapsed = stats['time']['lemma'] + stats['time']['search']
+        print(f"{'at least ' if count == limit else ''}{count} solution{'' if count == 1 else 's'} in {elapsed:.3f}s")
+        if args.stats:
+            write_stats(args.stats, count)
+        return 0 if (count == 1 and limit != 1) else 1
+
+    # The cache module imports hashi as a module of its own, the solver state here is __main__'s
+    entry = None
+    if (args.cache is not None):
+        import hashi_cache
+        cache = hashi_cache.SolutionCache(args.cache or hashi_cache.DEFAULT_CACHE_DIR)
+        entry = cache.get(i_map)
+    if entry is not None:
+        load_islands(i_map, nrow, ncol)
+        if entry['solved']:
+            apply_bridges(i_map, nrow, ncol, entry['bridges'])
+        stats.update(entry['stats'], cached=True)
+        is_solved = entry['solved']
+    else:
+        puzzle = i_map.copy()
+        is_solved = solve_map(i_map, nrow, ncol, args.engine, args.branching, tuning, probe=args.probe)
+        if (args.cache is not None):
+            cache.put(puzzle, list_bridges() if is_solved else None, stats)
+    stats['time']['parse'] = parse_time
     if tuning:
-        for node in nodes:
-            print(node)
-        for bridge in bridges:
-            print(bridge)
-    return 0
+        print_map(nrow, ncol, i_map)
+        print(capacity)
+        print(bridge_count)
+    if not is_solved:
+        print("hashi: no solution", file=sys.stderr)
+    else:
+        start = time.perf_counter()
+        print_map(nrow, ncol, i_map)
+        stats['time']['render'] = time.perf_counter() - start
+        if args.certificate:
+            write_certificate(args.certificate, nrow, ncol, list_bridges())
+    if args.stats:
+        write_stats(args.stats, is_solved)
+    return 0 if is_solved else 1
+
+def write_stats(path, is_solved):
+    import json
+    text = json.dumps(dict(stats, solved=bool(is_solved)), indent=1) + '\n'
+    if (path == '-'):
+        sys.stderr.write(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text)
+
+# Bridges as [row0, col0, row1, col1, count], the form of certificates and of hashi_verify
+def bridge_rows(bridges):
+    return [[xy_0[0], xy_0[1], xy_1[0], xy_1[1], count] for (xy_0, xy_1, count) in bridges]
+
+# Certificate of a solution: the map size and every bridge
+def write_certificate(path, nrow, ncol, bridges):
+    import json
+    with open(path, 'w') as f:
+        json.dump({'rows': nrow, 'cols': ncol, 'bridges': bridge_rows(bridges)}, f)
+        f.write('\n')
 
 def scan_map():
-    text = []
-    for line in sys.stdin:
-        # print(f'line = {line}')
-        row = []
-        for ch in line:
-            n = ord(ch)
-            # print(f'ch = ${ch}, ch = ${n}')
-            if n >= 48 and n <= 57:    # between '0' and '9'
-                row.append(n - 48)
-            elif n >= 97 and n <= 122: # between 'a' and 'z'
-                row.append(n - 87)
-            
-            elif ch == '.':
-                row.append(0)
-        text.append(row)
-
-    nrow = len(text)
-    ncol = len(text[0])
-
-    map = np.zeros((nrow,ncol),dtype=np.int32)
-    for r in range(nrow):
-        # print(text[r])
-        for c in range(ncol):
-            map[r,c] = text[r][c]
-    
-    return nrow, ncol, map
+    return parse_map(sys.stdin.buffer.read())
 
+# Parse a whole map at once: every byte is translated through cell_table into an int8 grid.
+# Blank lines (empty or whitespace only) before and after the map are skipped, rows are counted from
+# the first line of the map. Raises ValueError naming the first ragged row (one not as wide as most
+# rows) or bad character.
+def parse_map(data, table=cell_table):
+    if isinstance(data, str):
+        data = data.encode()
+    data = data.replace(b'\r\n', b'\n')
+    data = re.sub(rb'(\n[ \t\r]*)+\Z', b'', re.sub(rb'\A([ \t\r]*\n)+', b'', data)) + b'\n'
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw == ord('\n'))
+    widths = np.diff(ends, prepend=-1) - 1
+    nrow = len(ends)
+    ncol = int(np.bincount(widths).argmax())
+    if (ncol == 0):
+        raise ValueError("empty map")
+    ragged = np.flatnonzero(widths != ncol)
+    if len(ragged):
+        r = ragged[0]
+        row = data[ends[r] - widths[r]:ends[r]]
+        stray = ", it ends in whitespace" if row != row.rstrip() else ""
+        raise ValueError(f"row {r + 1} has {widths[r]} cells, expected {ncol} as in most rows{stray}")
+    grid = table[raw.reshape(nrow, ncol + 1)[:, :ncol]]
+    bad = np.argwhere(grid == BAD_CELL)
+    if len(bad):
+        (r, c) = bad[0]
+        raise ValueError(f"bad character {chr(data[r * (ncol + 1) + c])!r} at row {r + 1}, column {c + 1}")
+    return nrow, ncol, grid
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
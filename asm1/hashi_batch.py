@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+#************************************************************
+#   hashi_batch.py
+#   Solve many hashi puzzles in parallel.
+#
+#   Puzzles are taken from directories (every *.in in them), glob patterns, files, or stdin ('-').
+#   A file or stdin may hold several puzzles separated by blank lines.
+#
+#   Every worker process of the pool solves one puzzle at a time with hashi.solve_map(); the
+#   solver state lives in the worker's copy of the hashi module and load_islands() rebuilds it
+#   for every puzzle. A worker still busy when the per-puzzle timeout expires is killed and
+#   replaced. Results are printed in input order as soon as all the puzzles before them are done;
+#   every solution is checked with hashi_verify before it is printed.
+#   With --cache the workers share the solution cache of hashi_cache.py, so puzzles solved
+#   before (in any rotation or reflection) are not solved again.
+#   With --count N the solutions of every puzzle are counted instead, up to N, with
+#   hashi.count_solutions(): --count 2 checks which puzzles have a unique solution.
+#
+#   Usage: python3 hashi_batch.py [-j 4] [--timeout 30] [--engine dfs|sat] [--cache [DIR]] [--count N] inputs/ 'maps/*.in' - ...
+import argparse
+import glob
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import sys
+import time
+import hashi
+import hashi_cache
+import hashi_verify
+
+# Split a text holding one or more maps separated by blank lines (any number of them, blank
+# meaning empty or whitespace only) into the text of every map
+def split_puzzles(text):
+    return [block.strip('\r\n') for block in re.split(r'\n(?:[ \t\r]*\n)+', '\n' + text) if block.strip()]
+
+# Expand the command line sources into a list of (name, map text)
+def collect_puzzles(sources):
+    puzzles = []
+    for source in sources:
+        if source == '-':
+            paths = [None]
+        elif os.path.isdir(source):
+            paths = sorted(glob.glob(os.path.join(source, '*.in')))
+        elif os.path.exists(source):
+            paths = [source]
+        else:
+            paths = sorted(glob.glob(source))
+            if not paths:
+                print(f"hashi_batch: no puzzles match {source}", file=sys.stderr)
+        for path in paths:
+            if path is None:
+                (name, text) = ('stdin', sys.stdin.read())
+            else:
+                with open(path) as f:
+                    (name, text) = (path, f.read())
+            maps = split_puzzles(text)
+            for k, block in enumerate(maps):
+                puzzles.append((name if len(maps) == 1 else f"{name}#{k + 1}", block))
+    return puzzles
+
+# Count the solutions of a map, up to limit (None for all)
+def count_text(text, branching, limit):
+    start = time.perf_counter()
+    try:
+        nrow, ncol, i_map = hashi.parse_map(text)
+        count = hashi.count_solutions(i_map, nrow, ncol, limit, branching)
+    except Exception as e:
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    # A cap of 1 tells whether there is a solution, not whether there is another one
+    if (count == 0):
+        status = 'unsolved'
+    elif (limit == 1):
+        status = 'solved'
+    else:
+        status = 'unique' if count == 1 else 'ambiguous'
+    return {
+        'status': status,
+        'time': time.perf_counter() - start,
+        'nodes': hashi.stats['nodes'],
+        'backtracks': hashi.stats['backtracks'],
+        'solutions': f"{'at least ' if count == limit else ''}{count} solution{'' if count == 1 else 's'}",
+    }
+
+def solve_text(text, engine, branching, cache=None):
+    start = time.perf_counter()
+    try:
+        nrow, ncol, i_map = hashi.parse_map(text)
+        puzzle = i_map.copy()
+        if cache is not None:
+            is_solved = hashi_cache.solve_cached(cache, i_map, nrow, ncol, engine, branching)
+        else:
+            is_solved = hashi.solve_map(i_map, nrow, ncol, engine, branching)
+    except Exception as e:
+        return {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    result = {
+        'status': 'solved' if is_solved else 'unsolved',
+        'time': time.perf_counter() - start,
+        'nodes': hashi.stats['nodes'],
+        'backtracks': hashi.stats['backtracks'],
+    }
+    if hashi.stats.get('cached'):
+        result['cached'] = True
+    if is_solved:
+        result['map'] = hashi.render_map(nrow, ncol, i_map)
+        errors = hashi_verify.verify_bridges(puzzle, hashi.bridge_rows(hashi.list_bridges()))
+        if errors:
+            result['status'] = 'wrong'
+            result['error'] = errors[0]
+    return result
+
+# Worker process: solve the puzzles sent over conn until it receives None
+# (count being the --count limit, 0 for all, None to solve them)
+def pool_worker(conn, engine, branching, cache_dir, count=None):
+    cache = None if cache_dir is None else hashi_cache.SolutionCache(cache_dir)
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        if count is not None:
+            conn.send(count_text(task, branching, count or None))
+        else:
+            conn.send(solve_text(task, engine, branching, cache))
+
+class Worker:
+    def __init__(self, engine, branching, cache_dir, count=None):
+        (self.conn, child_conn) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=pool_worker, args=(child_conn, engine, branching, cache_dir, count),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+
+    def submit(self, num, text):
+        self.task = num
+        self.started = time.monotonic()
+        self.conn.send(text)
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+# Solve the puzzles on num_workers processes, yields (num, result) in completion order
+def run_pool(puzzles, num_workers, timeout, engine, branching, cache_dir=None, count=None):
+    todo = list(range(len(puzzles)))[::-1]
+    workers = [Worker(engine, branching, cache_dir, count) for _ in range(min(num_workers, len(puzzles)))]
+    try:
+        while todo or any(w.task is not None for w in workers):
+            for w in workers:
+                if w.task is None and todo:
+                    num = todo.pop()
+                    w.submit(num, puzzles[num][1])
+            busy = [w for w in workers if w.task is not None]
+            wait = None
+            if timeout is not None:
+                wait = max(0, min(w.started + timeout for w in busy) - time.monotonic())
+            ready = multiprocessing.connection.wait([w.conn for w in busy], wait)
+            for k, w in enumerate(workers):
+                if w.task is None:
+                    continue
+                if w.conn in ready:
+                    try:
+                        result = w.conn.recv()
+                    except EOFError:
+                        result = {'status': 'error', 'error': f"worker exited with {w.process.exitcode}"}
+                elif timeout is not None and time.monotonic() - w.started >= timeout:
+                    result = {'status': 'timeout', 'time': timeout}
+                else:
+                    continue
+                num = w.task
+                w.task = None
+                if (result['status'] == 'timeout' or not w.process.is_alive()):
+                    w.kill()
+                    workers[k] = Worker(engine, branching, cache_dir, count)
+                yield num, result
+    finally:
+        for w in workers:
+            if w.task is None:
+                w.conn.send(None)
+            else:
+                w.kill()
+
+def print_result(name, result):
+    line = f"== {name}: {result['status']}"
+    if 'time' in result:
+        line += f" in {result['time']:.3f}s"
+    if 'solutions' in result:
+        line += f", {result['solutions']}"
+    if 'nodes' in result:
+        line += f", {result['nodes']} nodes, {result['backtracks']} backtracks"
+    if result.get('cached'):
+        line += " (cached)"
+    if 'error' in result:
+        line += f" ({result['error']})"
+    print(line)
+    if 'map' in result:
+        print(result['map'])
+    else:
+        print()
+    sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve many hashi puzzles in parallel.")
+    parser.add_argument('sources', nargs='+', help="directories, files, glob patterns, or - for stdin")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds per puzzle (default: none)")
+    parser.add_argument('--branching', choices=list(hashi.BRANCHING_HEURISTICS), default=hashi.DEFAULT_BRANCHING)
+    parser.add_argument('--engine', choices=['dfs', 'sat'], default='dfs')
+    parser.add_argument('--cache', metavar='DIR', nargs='?', const=hashi_cache.DEFAULT_CACHE_DIR,
+                        help="use the solution cache in DIR (default: ~/.cache/hashi)")
+    parser.add_argument('--count', metavar='N', type=int,
+                        help="count the solutions of every puzzle instead (dfs only), up to N (2 for a uniqueness check, 0 for all)")
+    args = parser.parse_args()
+    if (args.count is not None and args.engine != 'dfs'):
+        parser.error("--count only works with --engine dfs")
+
+    puzzles = collect_puzzles(args.sources)
+    # Results arrive in completion order, print them in input order
+    done = {}
+    next_num = 0
+    num_solved = 0
+    goal = 'solved' if args.count in (None, 1) else 'unique'
+    for num, result in run_pool(puzzles, max(1, args.jobs), args.timeout, args.engine, args.branching, args.cache,
+                                args.count):
+        done[num] = result
+        num_solved += result['status'] == goal
+        while next_num in done:
+            print_result(puzzles[next_num][0], done.pop(next_num))
+            next_num += 1
+    print(f"{num_solved}/{len(puzzles)} {goal}", file=sys.stderr)
+    return 0 if num_solved == len(puzzles) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
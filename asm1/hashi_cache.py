@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+#************************************************************
+#   hashi_cache.py
+#   Persistent cache of solve results, keyed by a canonical hash of the puzzle.
+#
+#   The 8 rotations and reflections of a puzzle are the same puzzle: each of them is generated
+#   and the smallest (by shape, then cell bytes) is its canonical form. The cache key is the
+#   sha256 of the canonical form. An entry keeps the canonical grid (to rule out collisions),
+#   whether the puzzle was solved, the bridges in canonical coordinates and the solve stats.
+#   A solution found for one orientation is stored in canonical coordinates and mapped into
+#   the orientation of every later request, then checked with hashi_verify before it is used.
+#
+#   Entries are JSON files in the cache directory, one per puzzle, written atomically so that
+#   batch workers can share a cache. A hit refreshes the file's modification time; once there
+#   are more than max_entries files the least recently used ones are removed.
+import hashlib
+import json
+import os
+import numpy as np
+import hashi
+import hashi_verify
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hashi')
+DEFAULT_MAX_ENTRIES = 10000
+
+# Symmetry (k, flip): rotate by k quarter turns, then mirror left to right if flip
+def transform(grid, k, flip):
+    grid = np.rot90(grid, k)
+    return grid[:, ::-1] if flip else grid
+
+# The canonical form of the puzzle and the symmetry that turns the puzzle into it
+def canonical(puzzle):
+    best = None
+    for k in range(4):
+        for flip in (False, True):
+            grid = transform(puzzle, k, flip)
+            key = (grid.shape, grid.tobytes())
+            if best is None or key < best[0]:
+                best = (key, grid, (k, flip))
+    return np.ascontiguousarray(best[1]), best[2]
+
+# Cell (r, c) of the canonical grid came from cell (from_row[r, c], from_col[r, c]) of the puzzle
+def coordinate_maps(shape, symmetry):
+    (rows, cols) = np.indices(shape)
+    return transform(rows, *symmetry), transform(cols, *symmetry)
+
+class SolutionCache:
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, grid):
+        digest = hashlib.sha256(f"{grid.shape[0]}x{grid.shape[1]}:".encode() + grid.astype(np.int8).tobytes())
+        return os.path.join(self.path, digest.hexdigest() + '.json')
+
+    # The cached result for the puzzle as {'solved', 'bridges', 'stats'}, bridges in the
+    # ((x0, y0), (x1, y1), count) form of the puzzle's own orientation; None on a miss
+    # (an entry another process evicted meanwhile is a miss).
+    def get(self, puzzle):
+        (grid, symmetry) = canonical(puzzle)
+        path = self.entry_path(grid)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not np.array_equal(np.array(entry['grid'], dtype=puzzle.dtype).reshape(grid.shape), grid):
+            return None
+        bridges = None
+        if entry['solved']:
+            (from_row, from_col) = coordinate_maps(puzzle.shape, symmetry)
+            bridges = [((int(from_row[r0, c0]), int(from_col[r0, c0])), (int(from_row[r1, c1]), int(from_col[r1, c1])), count)
+                       for (r0, c0, r1, c1, count) in entry['bridges']]
+            if hashi_verify.verify_bridges(puzzle, hashi.bridge_rows(bridges)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return None
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return {'solved': entry['solved'], 'bridges': bridges, 'stats': entry['stats']}
+
+    # Store the result of a complete solve: bridges in the puzzle's orientation, None if unsolvable
+    def put(self, puzzle, bridges, stats):
+        (grid, symmetry) = canonical(puzzle)
+        rows = None
+        if bridges is not None:
+            (from_row, from_col) = coordinate_maps(puzzle.shape, symmetry)
+            (to_row, to_col) = (np.empty(puzzle.shape, dtype=np.int64), np.empty(puzzle.shape, dtype=np.int64))
+            (canon_rows, canon_cols) = np.indices(grid.shape)
+            to_row[from_row, from_col] = canon_rows
+            to_col[from_row, from_col] = canon_cols
+            rows = [[int(to_row[xy_0]), int(to_col[xy_0]), int(to_row[xy_1]), int(to_col[xy_1]), int(count)]
+                    for (xy_0, xy_1, count) in bridges]
+        entry = {'grid': grid.ravel().tolist(), 'solved': bridges is not None, 'bridges': rows, 'stats': stats}
+        path = self.entry_path(grid)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    # Other processes sharing the directory may remove entries at any time, the ones gone are skipped
+    def evict(self):
+        names = [name for name in os.listdir(self.path) if name.endswith('.json')]
+        if (len(names) <= self.max_entries):
+            return
+        entries = []
+        for name in names:
+            path = os.path.join(self.path, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+        entries.sort()
+        for (_, path) in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# hashi.solve_map() behind the cache. A hit leaves the cached bridges on i_map and the cached
+# stats (marked 'cached') in hashi.stats.
+def solve_cached(cache, i_map, nrow, ncol, engine='dfs', branching=hashi.DEFAULT_BRANCHING):
+    entry = cache.get(i_map)
+    if entry is not None:
+        hashi.load_islands(i_map, nrow, ncol)
+        if entry['solved']:
+            hashi.apply_bridges(i_map, nrow, ncol, entry['bridges'])
+        hashi.stats = dict(entry['stats'], cached=True)
+        return entry['solved']
+    puzzle = i_map.copy()
+    is_solved = hashi.solve_map(i_map, nrow, ncol, engine, branching)
+    if is_solved is not None:
+        cache.put(puzzle, hashi.list_bridges() if is_solved else None, hashi.stats)
+    return is_solved
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+#************************************************************
+#   hashi_parallel.py
+#   Split the DFS of one puzzle across worker processes (work stealing).
+#
+#   A subproblem is the list of decisions (island, slot, bridges) leading to a node of the search
+#   tree, on top of the state left by the lemma pass; hashi.replay_decisions() rebuilds the node.
+#   Every worker loads the map and runs the lemma pass once, then takes subproblems from a shared
+#   queue, rolling back to the post-lemma state with the undo trail between them.
+#   The search starts with the whole tree as a single subproblem. Whenever some workers are idle
+#   and the queue cannot feed them, a busy worker gives away the untried values of its shallowest
+#   choice point, one subproblem per value, so the top of the tree is split first and workers
+#   that run dry split the subtrees of the others.
+#   The map is unsolvable once no subproblem is queued or being searched.
+#
+#   Usage: python3 hashi_parallel.py [-j 4] [--timeout 60] < puzzle.in
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import hashi
+
+# Shared counters
+IDLE    = 0    # workers waiting for a subproblem
+QUEUED  = 1    # subproblems in the queue
+PENDING = 2    # subproblems queued or being searched
+
+class WorkPool:
+    def __init__(self):
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.lock = multiprocessing.Lock()
+        self.counters = multiprocessing.RawArray('i', 3)
+
+    def add(self, counter, delta):
+        with self.lock:
+            self.counters[counter] += delta
+
+    def put(self, decisions):
+        with self.lock:
+            self.counters[PENDING] += 1
+            self.counters[QUEUED] += 1
+        self.tasks.put(decisions)
+
+    def get(self):
+        self.add(IDLE, 1)
+        decisions = self.tasks.get()
+        with self.lock:
+            self.counters[IDLE] -= 1
+            self.counters[QUEUED] -= 1
+        return decisions
+
+    def is_hungry(self):
+        return self.counters[IDLE] > self.counters[QUEUED]
+
+# search() hook: while workers are starving, give away the untried values of the shallowest choice point
+def make_split(pool, base):
+    def split(stack, step):
+        if not pool.is_hungry():
+            return
+        for depth, choice in enumerate(stack):
+            if (choice[2] != choice[3]):
+                prefix = base + [(int(c[0]), int(c[1]), int(c[5])) for c in stack[:depth]]
+                for val in range(choice[2], choice[3], step):
+                    pool.put(prefix + [(int(choice[0]), int(choice[1]), int(val))])
+                choice[2] = choice[3]
+                return
+    return split
+
+# A worker that fails posts its error instead of bridges: its subproblem was not searched, so the
+# map cannot be called unsolvable any more
+def worker(pool, i_map, nrow, ncol, branching):
+    try:
+        hashi.load_islands(i_map, nrow, ncol)
+        is_solvable = hashi.propagate(i_map, nrow, ncol, False)
+        del hashi.trail[:]
+        while True:
+            decisions = pool.get()
+            hashi.undo(0)
+            is_solved = False
+            if (is_solvable and hashi.replay_decisions(decisions, i_map, nrow, ncol)):
+                is_solved = hashi.search(i_map, False, nrow, ncol, branching, split=make_split(pool, decisions))
+            if is_solved:
+                pool.results.put(hashi.list_bridges())
+                return
+            pool.add(PENDING, -1)
+    except Exception as e:
+        pool.results.put(f"{type(e).__name__}: {e}")
+
+# Solve the map on num_workers processes. Returns the bridges, None if the map is unsolvable,
+# False on timeout. Raises RuntimeError if a worker failed.
+def solve_parallel(i_map, nrow, ncol, num_workers, branching=hashi.DEFAULT_BRANCHING, timeout=None):
+    pool = WorkPool()
+    pool.put([])
+    workers = [multiprocessing.Process(target=worker, args=(pool, i_map.copy(), nrow, ncol, branching), daemon=True)
+               for _ in range(num_workers)]
+    for w in workers:
+        w.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    bridges = None
+    try:
+        while True:
+            try:
+                bridges = pool.results.get(timeout=0.05)
+                break
+            except queue.Empty:
+                pass
+            if pool.counters[PENDING] == 0 and pool.results.empty():
+                break
+            if (deadline is not None and time.monotonic() > deadline):
+                bridges = False
+                break
+            # Workers only exit on their own after posting a solution
+            if any(w.exitcode not in (None, 0) for w in workers) and pool.results.empty():
+                raise RuntimeError("a worker died")
+            if not any(w.is_alive() for w in workers):
+                raise RuntimeError("all workers exited")
+    finally:
+        for w in workers:
+            w.kill()
+            w.join()
+    if isinstance(bridges, str):
+        raise RuntimeError(f"worker failed: {bridges}")
+    return bridges
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a hashi puzzle read from stdin, splitting the search across processes.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument('--branching', choices=list(hashi.BRANCHING_HEURISTICS), default=hashi.DEFAULT_BRANCHING)
+    parser.add_argument('--timeout', type=float, default=None, help="give up after this many seconds")
+    args = parser.parse_args()
+    try:
+        nrow, ncol, i_map = hashi.scan_map()
+    except ValueError as e:
+        print(f"hashi_parallel: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        bridges = solve_parallel(i_map, nrow, ncol, max(1, args.jobs), args.branching, args.timeout)
+    except RuntimeError as e:
+        print(f"hashi_parallel: {e}", file=sys.stderr)
+        return 1
+    if not bridges:
+        print(f"hashi_parallel: {'timed out' if bridges is False else 'no solution'}", file=sys.stderr)
+        return 1
+    hashi.load_islands(i_map, nrow, ncol)
+    hashi.apply_bridges(i_map, nrow, ncol, bridges)
+    hashi.print_map(nrow, ncol, i_map)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+#************************************************************
+#   hashi_portfolio.py
+#   Race several solver configurations on one puzzle, one worker process each.
+#
+#   The configurations differ in branching heuristic, the order the amounts of bridges are
+#   tried in (most first, or ascending), the engine, and randomized restarts: mrv with random
+#   tie-breaks, restarted with a new seed and a doubled node limit every time the limit is hit,
+#   and failed-literal probing before every branch.
+#   The first worker to find a solution wins and the others are killed. A complete worker that
+#   runs out of choices proves the map unsolvable, which also ends the race.
+#
+#   Usage: python3 hashi_portfolio.py [-j 4] [--timeout 60] < puzzle.in
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import hashi
+
+# In order of preference: with -j n the first n are raced
+PORTFOLIO = [
+    {'name': 'mrv'},
+    {'name': 'sat', 'engine': 'sat'},
+    {'name': 'mrv-random', 'branching': 'mrv-random', 'restarts': True, 'seed': 1},
+    {'name': 'mrv-probe', 'probe': 2},
+    {'name': 'mrv-degree', 'branching': 'mrv-degree'},
+    {'name': 'mrv-ascending', 'ascending': True},
+    {'name': 'capacity', 'branching': 'capacity'},
+    {'name': 'mrv-random-2', 'branching': 'mrv-random', 'restarts': True, 'seed': 1000},
+    {'name': 'scan-reverse', 'branching': 'scan-reverse', 'ascending': True},
+]
+RESTART_NODES = 500
+
+# Run one configuration, returns True / False (complete answer) with the bridges found
+def run_config(i_map, nrow, ncol, config):
+    engine = config.get('engine', 'dfs')
+    branching = config.get('branching', hashi.DEFAULT_BRANCHING)
+    ascending = config.get('ascending', False)
+    seed = config.get('seed')
+    probe = config.get('probe', 0)
+    node_limit = RESTART_NODES if config.get('restarts') else None
+    while True:
+        work_map = i_map.copy()
+        result = hashi.solve_map(work_map, nrow, ncol, engine, branching,
+                                 ascending=ascending, node_limit=node_limit, seed=seed, probe=probe)
+        if result is not None:
+            return result, hashi.list_bridges() if result else None
+        node_limit *= 2
+        seed += 1
+
+def portfolio_worker(i_map, nrow, ncol, config, results):
+    (is_solved, bridges) = run_config(i_map, nrow, ncol, config)
+    results.put((config['name'], is_solved, bridges))
+
+# Race the configurations on the map. Returns (winning configuration name, bridges), bridges
+# being None if the map was proved unsolvable; (None, None) on timeout.
+# Raises RuntimeError if every worker exited without an answer.
+def solve_portfolio(i_map, nrow, ncol, configs=PORTFOLIO, timeout=None):
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=portfolio_worker, args=(i_map, nrow, ncol, config, results), daemon=True)
+               for config in configs]
+    for w in workers:
+        w.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    (name, bridges) = (None, None)
+    try:
+        while True:
+            try:
+                (name, is_solved, bridges) = results.get(timeout=0.05)
+                break
+            except queue.Empty:
+                pass
+            if (deadline is not None and time.monotonic() > deadline):
+                break
+            if not any(w.is_alive() for w in workers) and results.empty():
+                raise RuntimeError("all workers exited")
+    finally:
+        for w in workers:
+            w.kill()
+            w.join()
+    return name, bridges
+
+def main():
+    parser = argparse.ArgumentParser(description="Race several solver configurations on a hashi puzzle read from stdin.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of configurations raced, one process each (default: all cores)")
+    parser.add_argument('--timeout', type=float, default=None, help="give up after this many seconds")
+    parser.add_argument('-v', '--verbose', action='store_true', help="report the winner on stderr")
+    args = parser.parse_args()
+    try:
+        nrow, ncol, i_map = hashi.scan_map()
+    except ValueError as e:
+        print(f"hashi_portfolio: {e}", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    configs = PORTFOLIO[:max(1, args.jobs)]
+    try:
+        (name, bridges) = solve_portfolio(i_map, nrow, ncol, configs, args.timeout)
+    except RuntimeError as e:
+        print(f"hashi_portfolio: {e}", file=sys.stderr)
+        return 1
+    if args.verbose:
+        outcome = 'timed out' if name is None else f"{name} {'solved' if bridges is not None else 'proved unsolvable'}"
+        print(f"{outcome} after {time.perf_counter() - start:.3f}s", file=sys.stderr)
+
+    if bridges is None:
+        print(f"hashi_portfolio: {'timed out' if name is None else 'no solution'}", file=sys.stderr)
+        return 1
+    hashi.load_islands(i_map, nrow, ncol)
+    hashi.apply_bridges(i_map, nrow, ncol, bridges)
+    hashi.print_map(nrow, ncol, i_map)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
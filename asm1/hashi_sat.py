@@ -0,0 +1,376 @@
+#!/usr/bin/python3
+#************************************************************
+#   hashi_sat.py
+#   Solve a hashi puzzle by encoding it into CNF and running a small CDCL SAT solver on it.
+#
+#   Encoding, for the potential bridges (edges) numbered by hashi.load_islands():
+#       1. every edge e gets up to 3 variables b[e][k], "at least k+1 bridges on e",
+#          with b[e][k] -> b[e][k-1], and no more variables than the smaller island allows;
+#       2. every island: the b variables of its edges sum to exactly the island value,
+#          encoded with a totalizer (unary adder tree);
+#       3. every pair of crossing edges: not (b[e][0] and b[f][0]);
+#       4. connectivity is added lazily: whenever a model splits the islands into several
+#          groups, a cut clause asks for at least one bridge leaving every group, and the
+#          solver runs again keeping everything it learnt.
+#
+#   The solver is a plain CDCL: two watched literals, first-UIP clause learning,
+#   VSIDS-like variable activity, phase saving and Luby restarts.
+import heapq
+import sys
+import hashi
+
+# Counters of the last solve_sat() call, summed over the connectivity rounds
+decisions = 0
+conflicts = 0
+
+class CDCLSolver:
+    # Literals are DIMACS style: variable v > 0 is the literal v, its negation is -v.
+    def __init__(self):
+        self.num_vars = 0
+        self.value = [0]        # per variable: 1 true, -1 false, 0 unassigned
+        self.level = [0]
+        self.reason = [None]
+        self.activity = [0.0]
+        self.phase = [False]
+        self.watches = [[], []] # per literal (see watch_idx), clauses watching it
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.var_inc = 1.0
+        self.heap = []
+        self.in_heap = [False]  # per variable: an entry with its current activity is in the heap
+        self.is_decision = [False]
+        self.num_conflicts = 0
+        self.num_decisions = 0
+        self.ok = True
+        self.model = None
+
+    # Auxiliary variables (is_decision=False) are never branched on, unit propagation sets them
+    def new_var(self, is_decision=True):
+        self.num_vars += 1
+        self.value.append(0)
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(0.0)
+        self.phase.append(False)
+        self.watches.append([])
+        self.watches.append([])
+        self.in_heap.append(False)
+        self.is_decision.append(is_decision)
+        self.push_var(self.num_vars)
+        return self.num_vars
+
+    def push_var(self, var):
+        if self.is_decision[var]:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+            self.in_heap[var] = True
+
+    def watch_idx(self, lit):
+        return 2 * lit if lit > 0 else -2 * lit + 1
+
+    def lit_value(self, lit):
+        return self.value[lit] if lit > 0 else -self.value[-lit]
+
+    # Clauses can only be added between calls to solve(), the solver goes back to level 0 first
+    def add_clause(self, lits):
+        if not self.ok:
+            return False
+        self.backtrack(0)
+        clause = []
+        for lit in set(lits):
+            if -lit in clause or self.lit_value(lit) == 1:
+                return True
+            if self.lit_value(lit) == 0:
+                clause.append(lit)
+        if len(clause) == 0:
+            self.ok = False
+        elif len(clause) == 1:
+            self.enqueue(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.watches[self.watch_idx(clause[0])].append(clause)
+            self.watches[self.watch_idx(clause[1])].append(clause)
+        return self.ok
+
+    def enqueue(self, lit, reason):
+        var = abs(lit)
+        self.value[var] = 1 if lit > 0 else -1
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    # Unit propagation over the two watched literals of every clause.
+    # Returns the conflicting clause, None if no conflict.
+    def propagate(self):
+        value = self.value
+        watches = self.watches
+        trail = self.trail
+        while self.qhead < len(trail):
+            false_lit = -trail[self.qhead]
+            self.qhead += 1
+            false_idx = 2 * false_lit if false_lit > 0 else -2 * false_lit + 1
+            watching = watches[false_idx]
+            kept = []
+            for k, clause in enumerate(watching):
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                if (value[first] if first > 0 else -value[-first]) == 1:
+                    kept.append(clause)
+                    continue
+                for t in range(2, len(clause)):
+                    lit = clause[t]
+                    if (value[lit] if lit > 0 else -value[-lit]) != -1:
+                        clause[1], clause[t] = lit, clause[1]
+                        watches[2 * lit if lit > 0 else -2 * lit + 1].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if (value[first] if first > 0 else -value[-first]) == -1:
+                        kept.extend(watching[k + 1:])
+                        watches[false_idx] = kept
+                        self.qhead = len(trail)
+                        return clause
+                    self.enqueue(first, clause)
+            watches[false_idx] = kept
+        return None
+
+    def bump(self, var):
+        self.activity[var] += self.var_inc
+        self.in_heap[var] = False
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) if self.in_heap[v]]
+            heapq.heapify(self.heap)
+        elif self.value[var] == 0:
+            self.push_var(var)
+
+    # First-UIP conflict analysis. Returns the learnt clause (asserting literal first) and
+    # the level to go back to.
+    def analyze(self, conflict):
+        seen = set()
+        learnt = [0]
+        counter = 0
+        lit = None
+        idx = len(self.trail) - 1
+        cur_level = len(self.trail_lim)
+        clause = conflict
+        while True:
+            for q in (clause if lit is None else clause[1:]):
+                var = abs(q)
+                if var not in seen and self.level[var] > 0:
+                    seen.add(var)
+                    self.bump(var)
+                    if self.level[var] == cur_level:
+                        counter += 1
+                    else:
+                        learnt.append(q)
+            while abs(self.trail[idx]) not in seen:
+                idx -= 1
+            lit = self.trail[idx]
+            idx -= 1
+            clause = self.reason[abs(lit)]
+            counter -= 1
+            if counter == 0:
+                break
+        learnt[0] = -lit
+        back_level = 0
+        if len(learnt) > 1:
+            top = max(range(1, len(learnt)), key=lambda i: self.level[abs(learnt[i])])
+            learnt[1], learnt[top] = learnt[top], learnt[1]
+            back_level = self.level[abs(learnt[1])]
+        return learnt, back_level
+
+    def backtrack(self, level):
+        if len(self.trail_lim) <= level:
+            return
+        for lit in self.trail[self.trail_lim[level]:]:
+            var = abs(lit)
+            self.phase[var] = lit > 0
+            self.value[var] = 0
+            self.reason[var] = None
+            if not self.in_heap[var]:
+                self.push_var(var)
+        del self.trail[self.trail_lim[level]:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def pick_branch_var(self):
+        while self.heap:
+            (_, var) = heapq.heappop(self.heap)
+            self.in_heap[var] = False
+            if self.value[var] == 0:
+                return var
+        # Only auxiliary variables left unassigned
+        for var in range(1, self.num_vars + 1):
+            if self.value[var] == 0:
+                return var
+        return None
+
+    # Returns True (model in self.model) or False if the clauses are unsatisfiable
+    def solve(self):
+        if not self.ok:
+            return False
+        self.backtrack(0)
+        if self.propagate() is not None:
+            self.ok = False
+            return False
+        restart = 1
+        restart_conflicts = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.num_conflicts += 1
+                restart_conflicts += 1
+                if len(self.trail_lim) == 0:
+                    self.ok = False
+                    return False
+                learnt, back_level = self.analyze(conflict)
+                self.backtrack(back_level)
+                if len(learnt) == 1:
+                    self.enqueue(learnt[0], None)
+                else:
+                    self.watches[self.watch_idx(learnt[0])].append(learnt)
+                    self.watches[self.watch_idx(learnt[1])].append(learnt)
+                    self.enqueue(learnt[0], learnt)
+                self.var_inc /= 0.95
+                if restart_conflicts >= 100 * luby(restart):
+                    self.backtrack(0)
+                    restart += 1
+                    restart_conflicts = 0
+            else:
+                var = self.pick_branch_var()
+                if var is None:
+                    self.model = list(self.value)
+                    return True
+                self.num_decisions += 1
+                self.trail_lim.append(len(self.trail))
+                self.enqueue(var if self.phase[var] else -var, None)
+
+# Luby restart sequence 1, 1, 2, 1, 1, 2, 4, ...
+def luby(i):
+    size = 1
+    seq = 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) // 2
+        seq -= 1
+        i = i % size
+    return 2 ** seq
+
+# Totalizer: returns out where out[j] is true iff at least j+1 of the literals are true
+def totalizer(solver, lits):
+    if len(lits) <= 1:
+        return list(lits)
+    left = totalizer(solver, lits[:len(lits) // 2])
+    right = totalizer(solver, lits[len(lits) // 2:])
+    out = [solver.new_var(False) for _ in range(len(left) + len(right))]
+    for i in range(len(left) + 1):
+        for j in range(len(right) + 1):
+            # left >= i and right >= j  ->  out >= i + j
+            if i + j > 0:
+                clause = [out[i + j - 1]]
+                if i > 0: clause.append(-left[i - 1])
+                if j > 0: clause.append(-right[j - 1])
+                solver.add_clause(clause)
+            # left < i + 1 and right < j + 1  ->  out < i + j + 1
+            if i + j < len(out):
+                clause = [-out[i + j]]
+                if i < len(left): clause.append(left[i])
+                if j < len(right): clause.append(right[j])
+                solver.add_clause(clause)
+    return out
+
+def add_exactly(solver, lits, k):
+    if k > len(lits):
+        solver.add_clause([])
+        return
+    out = totalizer(solver, lits)
+    if k > 0:
+        solver.add_clause([out[k - 1]])
+    if k < len(out):
+        solver.add_clause([-out[k]])
+
+# Encode the islands loaded in hashi into the solver, returns the b variables of every edge
+def encode(solver):
+    edge_vars = []
+    for (idx_0, idx_1) in hashi.edge_ends:
+        most = min(hashi.MAX_BRIDGE_NUM, hashi.island_value[idx_0], hashi.island_value[idx_1])
+        lits = [solver.new_var() for _ in range(most)]
+        for k in range(1, len(lits)):
+            solver.add_clause([-lits[k], lits[k - 1]])
+        edge_vars.append(lits)
+    for edge, conflicts in enumerate(hashi.edge_conflicts):
+        for other in conflicts:
+            if edge < other:
+                solver.add_clause([-edge_vars[edge][0], -edge_vars[other][0]])
+    for idx in range(len(hashi.island_value)):
+        lits = []
+        for edge in hashi.edge_of[idx]:
+            if edge >= 0:
+                lits.extend(edge_vars[edge])
+        add_exactly(solver, lits, int(hashi.island_value[idx]))
+    return edge_vars
+
+# Groups of islands joined by the edges with at least one bridge
+def components(counts):
+    parent = list(range(len(hashi.island_value)))
+    def find(idx):
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+    for edge, (idx_0, idx_1) in enumerate(hashi.edge_ends):
+        if counts[edge] > 0:
+            parent[find(idx_0)] = find(idx_1)
+    groups = {}
+    for idx in range(len(parent)):
+        groups.setdefault(find(idx), set()).add(idx)
+    return list(groups.values())
+
+# Solve the map, returns the bridges as a list of ((x0, y0), (x1, y1), count), None if unsolvable
+def solve_sat(i_map, nrow, ncol, connectivity=True):
+    global decisions, conflicts
+    hashi.load_islands(i_map.copy(), nrow, ncol)
+    solver = CDCLSolver()
+    edge_vars = encode(solver)
+    bridges = None
+    while solver.solve():
+        counts = [sum(1 for lit in lits if solver.model[lit] > 0) for lits in edge_vars]
+        groups = components(counts)
+        if (not connectivity or len(groups) <= 1):
+            bridges = []
+            for edge, (idx_0, idx_1) in enumerate(hashi.edge_ends):
+                if counts[edge] > 0:
+                    bridges.append((tuple(int(v) for v in hashi.island_xy[idx_0]),
+                                    tuple(int(v) for v in hashi.island_xy[idx_1]), counts[edge]))
+            break
+        # Lazy connectivity cut: some bridge has to leave every group
+        for group in groups:
+            cut = [edge_vars[edge][0] for edge, (idx_0, idx_1) in enumerate(hashi.edge_ends)
+                   if edge_vars[edge] and ((idx_0 in group) != (idx_1 in group))]
+            solver.add_clause(cut)
+    decisions = solver.num_decisions
+    conflicts = solver.num_conflicts
+    return bridges
+
+def main():
+    try:
+        nrow, ncol, i_map = hashi.scan_map()
+    except ValueError as e:
+        print(f"hashi_sat: {e}", file=sys.stderr)
+        return 1
+    bridges = solve_sat(i_map, nrow, ncol)
+    if bridges is None:
+        print("hashi_sat: no solution", file=sys.stderr)
+        return 1
+    hashi.load_islands(i_map, nrow, ncol)
+    hashi.apply_bridges(i_map, nrow, ncol, bridges)
+    hashi.print_map(nrow, ncol, i_map)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
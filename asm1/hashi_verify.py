@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+#************************************************************
+#   hashi_verify.py
+#   Check a hashi solution against its puzzle, without solving anything.
+#
+#   The solution is either the map printed by the solver, or a certificate written with
+#   hashi.py --certificate: {"rows": r, "cols": c, "bridges": [[row0, col0, row1, col1, count], ...]}.
+#   A printed map is first checked cell by cell (same islands as the puzzle, every bridge cell
+#   part of a run of one kind of bridge between two islands) and turned into a list of bridges.
+#   The bridges are then checked the same way whichever form they came in:
+#       1. both ends are islands, on one row or column, with no island in between;
+#       2. 1 to 3 bridges, at most one entry per pair of islands;
+#       3. no two bridges cross;
+#       4. every island has exactly its value in bridges;
+#       5. all islands are connected.
+#   The checks work on whole arrays, only the connectivity check walks the bridges one by one.
+#
+#   Usage: python3 hashi_verify.py puzzle.in solution.out
+#          python3 hashi_verify.py puzzle.in --certificate solution.json
+import argparse
+import json
+import sys
+import numpy as np
+import hashi
+
+# Bridges of a printed solution as an (m, 5) array of [row0, col0, row1, col1, count],
+# and the errors found reading them
+def read_solution_grid(puzzle, grid):
+    errors = []
+    if (grid.shape != puzzle.shape):
+        return np.zeros((0, 5), dtype=np.int64), [f"solution is {grid.shape[0]}x{grid.shape[1]}, puzzle is {puzzle.shape[0]}x{puzzle.shape[1]}"]
+    num_codes = len(hashi.code)
+    island = np.where(grid < num_codes, grid, 0)
+    hori = np.where((grid >= num_codes) & (grid < num_codes + 3), grid - num_codes + 1, 0)
+    vert = np.where(grid >= num_codes + 3, grid - num_codes - 2, 0)
+    for (r, c) in np.argwhere(island != puzzle)[:5]:
+        errors.append(f"cell ({r}, {c}) is {chr(hashi.glyphs[grid[r, c]])!r}, the puzzle has {hashi.code[puzzle[r, c]]!r}")
+    # Every bridge cell continues with the same bridge or ends at an island on both sides
+    for (count, axis, name) in ((hori, 1, 'horizontal'), (vert, 0, 'vertical')):
+        padded = np.pad(count, 1)
+        ends = np.pad(puzzle > 0, 1)
+        body = (slice(1, -1), slice(1, -1))
+        broken = np.zeros(count.shape, dtype=bool)
+        for shift in (1, -1):
+            side_count = np.roll(padded, shift, axis=axis)[body]
+            side_island = np.roll(ends, shift, axis=axis)[body]
+            broken |= (count > 0) & (side_count != count) & ~side_island
+        for (r, c) in np.argwhere(broken)[:5]:
+            errors.append(f"{name} bridge at ({r}, {c}) does not run between two islands")
+    # A bridge between two consecutive islands of a row / column shows in the cell after the first one
+    xy = np.argwhere(puzzle > 0)
+    by_col = xy[np.lexsort((xy[:, 0], xy[:, 1]))]
+    bridges = []
+    for (order, count, axis) in ((xy, hori, 1), (by_col, vert, 0)):
+        (first, second) = (order[:-1], order[1:])
+        pair = (first[:, 1 - axis] == second[:, 1 - axis]) & (second[:, axis] - first[:, axis] > 1)
+        step = np.array([0, 1]) if axis == 1 else np.array([1, 0])
+        after = first[pair] + step
+        counts = count[after[:, 0], after[:, 1]]
+        built = counts > 0
+        bridges.append(np.column_stack([first[pair][built], second[pair][built], counts[built]]))
+    return np.concatenate(bridges).astype(np.int64), errors
+
+# Errors of a list of bridges [row0, col0, row1, col1, count] on the puzzle, empty if it solves it
+def verify_bridges(puzzle, bridges):
+    (nrow, ncol) = puzzle.shape
+    bridges = np.asarray(bridges, dtype=np.int64).reshape(-1, 5)
+    (r0, c0, r1, c1, count) = bridges.T
+    inside = (r0 >= 0) & (r0 < nrow) & (r1 >= 0) & (r1 < nrow) & (c0 >= 0) & (c0 < ncol) & (c1 >= 0) & (c1 < ncol)
+    if not inside.all():
+        return [f"bridge {bridges[~inside][0].tolist()} leaves the map"]
+    # Bridges always go east or south from their first island
+    swap = (r0 > r1) | ((r0 == r1) & (c0 > c1))
+    bridges[swap] = bridges[swap][:, [2, 3, 0, 1, 4]]
+    (r0, c0, r1, c1, count) = bridges.T
+    is_hor = r0 == r1
+    is_vert = c0 == c1
+    errors = []
+    for k in np.flatnonzero((puzzle[r0, c0] <= 0) | (puzzle[r1, c1] <= 0))[:5]:
+        errors.append(f"bridge {bridges[k].tolist()} does not join two islands")
+    for k in np.flatnonzero(is_hor == is_vert)[:5]:
+        errors.append(f"bridge {bridges[k].tolist()} is not horizontal or vertical")
+    for k in np.flatnonzero((count < 1) | (count > hashi.MAX_BRIDGE_NUM))[:5]:
+        errors.append(f"bridge {bridges[k].tolist()} has {count[k]} bridges, not 1 to {hashi.MAX_BRIDGE_NUM}")
+    (_, first, times) = np.unique(bridges[:, :4], axis=0, return_index=True, return_counts=True)
+    for k in first[times > 1][:5]:
+        errors.append(f"islands {bridges[k, :2].tolist()} and {bridges[k, 2:4].tolist()} are joined more than once")
+    if errors:
+        return errors
+
+    # Islands strictly between the ends, from running counts of islands along rows and columns
+    is_island = (puzzle > 0).astype(np.int32)
+    row_run = np.cumsum(is_island, axis=1)
+    col_run = np.cumsum(is_island, axis=0)
+    between = np.where(is_hor, row_run[r0, np.maximum(c1 - 1, 0)] - row_run[r0, c0],
+                       col_run[np.maximum(r1 - 1, 0), c0] - col_run[r0, c0])
+    for k in np.flatnonzero(between > 0)[:5]:
+        errors.append(f"bridge {bridges[k].tolist()} runs over an island")
+    # Cells covered by horizontal / vertical bridges, from +1 / -1 marks at both ends of every bridge
+    cover = []
+    for (sel, axis) in ((is_hor, 1), (is_vert, 0)):
+        marks = np.zeros((nrow + 1, ncol + 1), dtype=np.int32)
+        if (axis == 1):
+            np.add.at(marks, (r0[sel], c0[sel] + 1), 1)
+            np.add.at(marks, (r1[sel], c1[sel]), -1)
+        else:
+            np.add.at(marks, (r0[sel] + 1, c0[sel]), 1)
+            np.add.at(marks, (r1[sel], c1[sel]), -1)
+        cover.append(np.cumsum(marks, axis=axis)[:nrow, :ncol])
+    for (r, c) in np.argwhere((cover[0] > 0) & (cover[1] > 0))[:5]:
+        errors.append(f"bridges cross at ({r}, {c})")
+    # Bridges at every island
+    total = np.zeros((nrow, ncol), dtype=np.int32)
+    np.add.at(total, (r0, c0), count)
+    np.add.at(total, (r1, c1), count)
+    for (r, c) in np.argwhere((puzzle > 0) & (total != puzzle))[:5]:
+        errors.append(f"island ({r}, {c}) has {total[r, c]} bridges, needs {puzzle[r, c]}")
+    if errors:
+        return errors
+
+    # Connectivity, with a union-find over the islands
+    island_at = np.full((nrow, ncol), -1, dtype=np.int64)
+    xy = np.argwhere(puzzle > 0)
+    island_at[xy[:, 0], xy[:, 1]] = np.arange(len(xy))
+    parent = list(range(len(xy)))
+    def find(idx):
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+    groups = len(xy)
+    for (idx_0, idx_1) in zip(island_at[r0, c0].tolist(), island_at[r1, c1].tolist()):
+        (root_0, root_1) = (find(idx_0), find(idx_1))
+        if (root_0 != root_1):
+            parent[root_0] = root_1
+            groups -= 1
+    if (groups > 1):
+        errors.append(f"islands are split into {groups} unconnected groups")
+    return errors
+
+def verify_grid(puzzle, grid):
+    (bridges, errors) = read_solution_grid(puzzle, grid)
+    return errors if errors else verify_bridges(puzzle, bridges)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a hashi solution against its puzzle.")
+    parser.add_argument('puzzle', help="the puzzle map")
+    parser.add_argument('solution', nargs='?', help="the solved map printed by hashi.py")
+    parser.add_argument('--certificate', metavar='FILE', help="check the bridges written by hashi.py --certificate instead")
+    args = parser.parse_args()
+    if (args.solution is None) == (args.certificate is None):
+        parser.error("give either a solution map or --certificate")
+
+    try:
+        with open(args.puzzle, 'rb') as f:
+            (_, _, puzzle) = hashi.parse_map(f.read())
+        if args.certificate:
+            with open(args.certificate) as f:
+                certificate = json.load(f)
+            if [certificate['rows'], certificate['cols']] != list(puzzle.shape):
+                errors = [f"certificate is for a {certificate['rows']}x{certificate['cols']} map"]
+            else:
+                errors = verify_bridges(puzzle, certificate['bridges'])
+        else:
+            with open(args.solution, 'rb') as f:
+                (_, _, grid) = hashi.parse_map(f.read(), hashi.glyph_table)
+            errors = verify_grid(puzzle, grid)
+    except (OSError, ValueError, KeyError) as e:
+        errors = [f"cannot read: {e}"]
+    for error in errors:
+        print(error)
+    print("INVALID" if errors else "VALID")
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,7 @@
 #
 import numpy as np
 import sys
+import hashi
 nrow = 0
 ncol = 0
 code = ".123456789abc"
@@ -395,139 +396,35 @@ def solve(i_map, node_dict_list, bridge_dict_list, nrow, ncol, i, j, is_test):
 
     return True
 
+# The lemma pass and the search are the ones of hashi.py: the node / bridge lists and the recursive
+# solve() above are the first prototype, which needs a Python frame for every neighbour step
+# (overflowing the stack on larger maps) and can build more bridges than a slot takes
 def main():
-    nrow, ncol, i_map = scan_map()
-    ccc = 0
-    # Get islands/nodes
-    for r in range(nrow):
-        for c in range(ncol):
-            if(i_map[r,c] > 0):
-                nodes.append({
-                    'xy': (r,c),
-                    'value':    i_map[r,c],
-                    'capacity': i_map[r,c],
-                    'neighbours': find_neighbours((r, c), i_map, nrow, ncol),
-                    # 'neighbour_of': [],
-                    'is_completed': False,
-                    'position': len(nodes),
-                    # 'bridges': []
-                })
-                # cur_node = nodes[len(nodes) - 1]
-    # For all nodes, give them easier access to their neighbours position
-    for node_idx, node in enumerate(nodes):
-        new = []
-        neighbours = node['neighbours']
-        for neighbour in neighbours:
-            neighbour_idx = find_node(neighbour, nodes)
-            new.append({
-                'node': neighbour,
-                'position': neighbour_idx,
-            })
-            # nodes[neighbour_idx]['neighbour_of'].append({
-            #     'node': node['xy'],
-            #     'position': node_idx,
-            # })
-        node['neighbours'] = new
-
-    # print(f"Initialisation complete:")
-    # for node in nodes:
-    #     print(node)
+    try:
+        nrow, ncol, i_map = hashi.scan_map()
+    except ValueError as e:
+        print(f"scan_print_map: {e}", file=sys.stderr)
+        return 1
     # For all nodes, try apply the lemma to link islands that must be connected before applying other search strategies
-    init_complete = False
     print("Start checking lemma")
-    while (not init_complete):
-        init_complete = True
-        ccc+=1
-        # print(f"\n\nIterating\n\n")
-        for idx, node in enumerate(nodes):
-            # May also want to update check_lemma to iterate using the list of dict
-            if check_lemma(node):
-                # print(f"Node: {node['xy']} satisfies lemma. Building bridges.")
-                init_complete = False
-                neighbours = node['neighbours']
-                if len(neighbours) == 1:
-                    build_bridge(node['xy'], neighbours[0]['node'], idx, i_map, -node['capacity'], nrow, ncol, nodes, bridges)
-                elif (node['capacity'] == (len(node['neighbours']) * MAX_BRIDGE_NUM)):
-                    for neighbour in neighbours:
-                        build_bridge(node['xy'], neighbour['node'], idx, i_map, -3, nrow, ncol, nodes, bridges)
-                elif (node['value'] == (len(node['neighbours']) * MAX_BRIDGE_NUM)):
-                    for neighbour in neighbours:
-                        bridge_idx = bridge_contains(node['xy'], neighbour['node'], bridges)
-                        if bridge_idx > -1:
-                            # print(f"OVERWRITING EXISTING BRIDGE:\n\t{bridges[bridge_idx]}\n")
-                            build_bridge(node['xy'], neighbour['node'], idx, i_map, -3 - bridges[bridge_idx]['val'], nrow, ncol, nodes, bridges)
-                        else:
-                            build_bridge(node['xy'], neighbour['node'], idx, i_map, -3, nrow, ncol, nodes, bridges)
-                else:
-                    for neighbour in neighbours:
-                        build_bridge(node['xy'], neighbour['node'], idx, i_map, -1, nrow, ncol, nodes, bridges)
-                # Post-Lemma Pre-DFS map result
+    hashi.load_islands(i_map, nrow, ncol)
+    is_solvable = hashi.propagate(i_map, nrow, ncol, False)
+    # Post-Lemma Pre-DFS map result
     print("finished checking lemma")
-    print_map(nrow, ncol, i_map)
+    hashi.print_map(nrow, ncol, i_map)
     print()
-            # else:
-                # print("Lemma unsatisfied\n")
-    
-    # Start dfs brutal search
-    dfs_nodes = []
-    incompleted_nodes = []
-    for node in nodes:
-        incompleted_nodes.append(node)
-    dfs_nodes.append({
-        'nodes': incompleted_nodes,
-        'iter'  : 0,
-    })
-
-    dfs_bridges = []
-    fixed_bridges = []
-    for bridge in bridges:
-        fixed_bridges.append(bridge)
-    dfs_bridges.append({
-        'bridges': fixed_bridges,
-        'iter'  : 0,
-    })
-    # print(f"dfs nodes: {dfs_nodes}\ndfs bridges: {dfs_bridges}")
-    sys.setrecursionlimit(100)
-    tuning = False
-    solve(i_map, nodes, bridges, nrow, ncol, 0, 0, tuning)
-    print_map(nrow, ncol, i_map)
-    # if (solve(i_map, dfs_nodes, dfs_bridges, nrow, ncol)):
-    #     print("SUCCESS")
 
-    # for node in nodes:
-    #     print(node)
-    # for bridge in bridges:
-    #     print(bridge)
+    # Start dfs search from the post-lemma state
+    del hashi.trail[:]
+    if not (is_solvable and hashi.search(i_map, False, nrow, ncol)):
+        print("scan_print_map: no solution", file=sys.stderr)
+        return 1
+    hashi.print_map(nrow, ncol, i_map)
     return 0
 
 def scan_map():
-    text = []
-    for line in sys.stdin:
-        # print(f'line = {line}')
-        row = []
-        for ch in line:
-            n = ord(ch)
-            # print(f'ch = ${ch}, ch = ${n}')
-            if n >= 48 and n <= 57:    # between '0' and '9'
-                row.append(n - 48)
-            elif n >= 97 and n <= 122: # between 'a' and 'z'
-                row.append(n - 87)
-            
-            elif ch == '.':
-                row.append(0)
-        text.append(row)
-
-    nrow = len(text)
-    ncol = len(text[0])
-
-    map = np.zeros((nrow,ncol),dtype=np.int32)
-    for r in range(nrow):
-        # print(text[r])
-        for c in range(ncol):
-            map[r,c] = text[r][c]
-    
-    return nrow, ncol, map
-
+    nrow, ncol, map = hashi.scan_map()
+    return nrow, ncol, map.astype(np.int32)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+#************************************************************
+#   test_hashi.py
+#   Checks of the hashi solver on the puzzles in inputs/.
+#
+#   Usage: python3 -m pytest test_hashi.py
+import glob
+import os
+import pytest
+import hashi
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PUZZLES = sorted(glob.glob(os.path.join(HERE, 'inputs', '*.in')))
+
+def load(path):
+    with open(path, 'rb') as f:
+        return hashi.parse_map(f.read())
+
+# The lemma pass runs until no rule applies to any island
+@pytest.mark.parametrize('path', PUZZLES, ids=os.path.basename)
+def test_propagate_reaches_fixpoint(path):
+    nrow, ncol, i_map = load(path)
+    hashi.load_islands(i_map, nrow, ncol)
+    if not hashi.propagate(i_map, nrow, ncol, False):
+        pytest.skip("no solution")
+    assert [idx for idx in range(len(hashi.capacity)) if hashi.check_lemma(idx) != -1] == []
+
+# Blank lines around the map are skipped, errors name the row that is out of line
+def test_parse_map_skips_blank_lines():
+    assert hashi.parse_map("\n \n1.1\n...\n\n\t\n")[:2] == (2, 3)
+
+@pytest.mark.parametrize('text, error', [
+    ("", "empty map"),
+    ("1.1 \n...\n1.1\n", "row 1 has 4 cells, expected 3 as in most rows, it ends in whitespace"),
+    ("1.1\n..\n1.1\n", "row 2 has 2 cells, expected 3 as in most rows"),
+    ("1.1\n...\n..x\n", "bad character 'x' at row 3, column 3"),
+])
+def test_parse_map_errors(text, error):
+    with pytest.raises(ValueError, match=error):
+        hashi.parse_map(text)
+
+# Solution counts of the small maps, checked against a brute-force enumeration of every bridge layout
+@pytest.mark.parametrize('name, count', [
+    ('eight_1.in', 39), ('six_1.in', 16), ('seven_1.in', 26), ('solved_four_1.in', 2),
+    ('five_2.in', 1), ('invalid.in', 0),
+])
+def test_count_solutions(name, count):
+    nrow, ncol, i_map = load(os.path.join(HERE, 'inputs', name))
+    assert hashi.count_solutions(i_map.copy(), nrow, ncol, limit=None) == count
+    assert hashi.count_solutions(i_map, nrow, ncol, limit=2) == min(count, 2)
@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+#************************************************************
+#   test_hashi_batch.py
+#   Checks of the puzzle stream splitting of hashi_batch.
+#
+#   Usage: python3 -m pytest test_hashi_batch.py
+import hashi
+import hashi_batch
+
+FIRST = "2.2\n...\n2.2"
+SECOND = "1.1"
+
+def test_split_puzzles_single_blank_line():
+    assert hashi_batch.split_puzzles(f"{FIRST}\n\n{SECOND}\n") == [FIRST, SECOND]
+
+def test_split_puzzles_several_blank_lines():
+    assert hashi_batch.split_puzzles(f"{FIRST}\n\n\n\n{SECOND}") == [FIRST, SECOND]
+
+def test_split_puzzles_whitespace_lines():
+    assert hashi_batch.split_puzzles(f"{FIRST}\r\n\r\n{SECOND}\r\n") == [FIRST, SECOND]
+    assert hashi_batch.split_puzzles(f" \n{FIRST}\n \t\n\r\n\n{SECOND}\n\t\n") == [FIRST, SECOND]
+
+# Every block is a map of its own
+def test_split_puzzles_parse():
+    for block in hashi_batch.split_puzzles(f"\n\n{FIRST}\n\n\n{SECOND}\n\n"):
+        hashi.parse_map(block)